@@ -0,0 +1,78 @@
+"""Post delete latency as the number of likes on the post grows.
+
+Deletes posts carrying --likes likes each, the way blog.delete does:
+``cascade`` leaves the liked_posts rows to ON DELETE CASCADE, ``orm``
+loads the post's likes first, as the relationship cascade did before
+passive_deletes, so the session deletes them row by row.
+
+    python -m benchmarks.bench_delete --likes 1000 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from flaskr.database import db
+from flaskr.models import LikedPosts, Post, User
+
+from benchmarks.common import make_app, summarize
+
+POSTS = 5
+
+
+def fill(likes):
+    db.session.execute(db.insert(User), [{'username': f'user{i}', 'password': ''} for i in range(likes)])
+    db.session.execute(db.insert(Post), [
+        {'title': f'post {i}', 'body': '', 'author_id': 1, 'likes': likes} for i in range(POSTS)
+    ])
+    db.session.execute(db.insert(LikedPosts), [
+        {'user_id': user_id, 'post_id': post_id}
+        for post_id in range(1, POSTS + 1) for user_id in range(1, likes + 1)
+    ])
+    db.session.commit()
+
+
+def delete_post(post_id, load_likes):
+    post = db.session.get(Post, post_id)
+    if load_likes:
+        post.liked_posts
+    db.session.delete(post)
+    db.session.commit()
+
+
+def run(likes, load_likes):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'delete.db'))
+        with app.app_context():
+            db.create_all()
+            fill(likes)
+            statements = []
+            record = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', record)
+            samples = []
+            for post_id in range(1, POSTS + 1):
+                start = time.perf_counter()
+                delete_post(post_id, load_likes)
+                samples.append(time.perf_counter() - start)
+                db.session.expunge_all()
+            event.remove(db.engine, 'before_cursor_execute', record)
+            left = db.session.execute(db.select(db.func.count()).select_from(LikedPosts)).scalar()
+    return summarize(samples), len(statements) / POSTS, left
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--likes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'likes':>8} {'mode':>8} {'p50 ms':>9} {'statements':>11} {'rows left':>10}")
+    for likes in args.likes:
+        for mode in ('orm', 'cascade'):
+            stats, statements, left = run(likes, load_likes=mode == 'orm')
+            print(f"{likes:>8} {mode:>8} {stats['p50_ms']:>9.1f} {statements:>11.0f} {left:>10}")
+
+
+if __name__ == '__main__':
+    main()
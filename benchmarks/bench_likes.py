@@ -0,0 +1,115 @@
+"""Like throughput on one hot post, with and without the write-behind counter.
+
+Worker processes share one SQLite file with the production PRAGMAs and
+each toggles likes on the same post for --duration seconds, every request
+as a different user. Afterwards the counter is checked against the
+liked_posts rows.
+
+    python -m benchmarks.bench_likes --workers 1 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_app
+
+USERS_PER_WORKER = 50
+
+
+def settings(write_behind):
+    from flaskr.config import ProductionConfig
+    return {
+        'SQLITE_PRAGMAS': ProductionConfig.SQLITE_PRAGMAS,
+        'SQLALCHEMY_ENGINE_OPTIONS': ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+        'LIKES_WRITE_BEHIND': write_behind,
+    }
+
+
+def seed(db_path, users):
+    from flaskr.database import db
+    from flaskr.models import Post, User
+
+    app = make_app(db_path)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [{'username': f'user{i}', 'password': ''} for i in range(users)])
+        db.session.add(Post(title='viral', body='', author_id=1, likes=0))
+        db.session.commit()
+
+
+def worker(db_path, write_behind, first_user, duration, results):
+    from flask_jwt_extended import create_access_token
+    from flaskr.blog import flush_like_buffer
+    from flaskr.database import db
+    from flaskr.models import User
+
+    app = make_app(db_path, TESTING=False, **settings(write_behind))
+    clients = []
+    with app.app_context():
+        for user_id in range(first_user, first_user + USERS_PER_WORKER):
+            client = app.test_client()
+            client.set_cookie('access_token_cookie',
+                              create_access_token(identity=db.session.get(User, user_id)))
+            clients.append(client)
+
+    done = failed = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for client in clients:
+            if client.post('/1/like').status_code == 302:
+                done += 1
+            else:
+                failed += 1
+    if write_behind:
+        # multiprocessing children skip atexit
+        with app.app_context():
+            flush_like_buffer(app.extensions['like_buffer'])
+    results.put((done, failed))
+
+
+def run(write_behind, workers, duration):
+    from flaskr.database import db
+    from flaskr.models import LikedPosts, Post
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'likes.db')
+        seed(db_path, workers * USERS_PER_WORKER)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(
+                db_path, write_behind, 1 + i * USERS_PER_WORKER, duration, results))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        app = make_app(db_path)
+        with app.app_context():
+            likes = db.session.execute(db.select(Post.likes).where(Post.id == 1)).scalar()
+            rows = db.session.execute(db.select(db.func.count()).select_from(LikedPosts)).scalar()
+    done = sum(done for done, _ in totals)
+    failed = sum(failed for _, failed in totals)
+    return done / duration, failed, likes == rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'workers':>8} {'likes/s':>9} {'failed':>7} {'consistent':>11}")
+    for workers in args.workers:
+        for write_behind in (False, True):
+            throughput, failed, consistent = run(write_behind, workers, args.duration)
+            mode = 'write-behind' if write_behind else 'direct'
+            print(f"{mode:>12} {workers:>8} {throughput:>9.0f} {failed:>7} {str(consistent):>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Search latency as the post table grows.
+
+Fills a fresh database with synthetic posts in steps and times
+search_posts() for a rare word, a common word and a two word query at
+each size. With the FTS5 index, latency follows the number of matches
+rather than the number of posts.
+
+    python -m benchmarks.bench_search --sizes 10000 100000 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+
+from flaskr.database import db
+from flaskr.search import search_posts
+
+from benchmarks.common import make_app, summarize, timings
+
+VOCABULARY = 20000
+
+
+def fill(conn, rng, start, stop, batch=10000):
+    # Zipf-like word frequencies so common and rare terms both exist
+    words = [f'w{rank}' for rank in range(VOCABULARY)]
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY)))
+    for low in range(start, stop, batch):
+        rows = []
+        for _ in range(low, min(stop, low + batch)):
+            title = ' '.join(rng.choices(words, cum_weights=weights, k=5))
+            body = ' '.join(rng.choices(words, cum_weights=weights, k=40))
+            rows.append((1, title, body))
+        conn.executemany(
+            "INSERT INTO post (author_id, created, title, body, likes) "
+            "VALUES (?, CURRENT_TIMESTAMP, ?, ?, 0)", rows)
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    queries = {'rare': 'w15000', 'common': 'w50', 'two words': 'w3 w900'}
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'search.db'))
+        with app.app_context():
+            db.create_all()
+            db.session.execute(db.text(
+                "INSERT INTO user (username, password) VALUES ('bench', '')"))
+            db.session.commit()
+            conn = db.engine.raw_connection()
+            size = 0
+            print(f"{'posts':>10} {'query':>10} {'p50 ms':>9} {'p95 ms':>9}")
+            for target in sorted(args.sizes):
+                fill(conn, rng, size, target)
+                size = target
+                for name, text in queries.items():
+                    stats = summarize(timings(lambda: search_posts(text), args.repeat))
+                    print(f"{size:>10} {name:>10} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f}")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
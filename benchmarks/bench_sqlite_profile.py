@@ -0,0 +1,115 @@
+"""Mixed read/write throughput of the SQLite profiles across worker counts.
+
+Every worker is a separate process with its own app on one shared
+database file, like a pre-forking server. Each loops for --duration
+seconds, viewing the feed and, --write-ratio of the time, toggling a like,
+and counts completed requests and failures such as "database is locked".
+The default profile runs with the base config, the production profile
+with ProductionConfig's PRAGMAs and engine options.
+
+    python -m benchmarks.bench_sqlite_profile --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import make_app
+
+PROFILES = ('default', 'production')
+
+
+def profile_settings(profile):
+    if profile == 'default':
+        return {}
+    from flaskr.config import ProductionConfig
+    return {
+        'SQLALCHEMY_ENGINE_OPTIONS': ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+        'SQLITE_PRAGMAS': ProductionConfig.SQLITE_PRAGMAS,
+    }
+
+
+def seed(db_path, users, posts):
+    from flaskr.database import db
+    from flaskr.models import Post, User
+
+    app = make_app(db_path)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'password': ''} for i in range(users)
+        ])
+        db.session.execute(db.insert(Post), [
+            {'title': f'post {i}', 'body': 'body ' * 20, 'author_id': 1 + i % users, 'likes': 0}
+            for i in range(posts)
+        ])
+        db.session.commit()
+
+
+def worker(db_path, profile, user_id, posts, duration, write_ratio, results):
+    from flask_jwt_extended import create_access_token
+    from flaskr.database import db
+    from flaskr.models import User
+
+    # failures are counted here, not raised through the test client
+    app = make_app(db_path, TESTING=False, **profile_settings(profile))
+    with app.app_context():
+        token = create_access_token(identity=db.session.get(User, user_id))
+    client = app.test_client()
+    client.set_cookie('access_token_cookie', token)
+    rng = random.Random(user_id)
+
+    done = failed = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        if rng.random() < write_ratio:
+            response = client.post(f'/{rng.randint(1, posts)}/like')
+            ok = response.status_code == 302
+        else:
+            ok = client.get('/').status_code == 200
+        if ok:
+            done += 1
+        else:
+            failed += 1
+    results.put((done, failed))
+
+
+def run(profile, workers, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        seed(db_path, max(workers, 1), args.posts)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(
+                db_path, profile, i + 1, args.posts, args.duration, args.write_ratio, results))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    done = sum(done for done, _ in totals)
+    failed = sum(failed for _, failed in totals)
+    return done / args.duration, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--posts', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'profile':>10} {'workers':>8} {'req/s':>9} {'failed':>7}")
+    for workers in args.workers:
+        for profile in PROFILES:
+            throughput, failed = run(profile, workers, args)
+            print(f"{profile:>10} {workers:>8} {throughput:>9.0f} {failed:>7}")
+
+
+if __name__ == '__main__':
+    main()
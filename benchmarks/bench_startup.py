@@ -0,0 +1,80 @@
+"""Cold start of a worker: importing flaskr, create_app() and the first request.
+
+Every sample runs in a fresh interpreter, as a newly spawned worker
+would, against a seeded SQLite file. The first request is a logged in
+GET of the index, so it includes the first connection, template
+compilation and JWT decoding.
+
+    python -m benchmarks.bench_startup --repeat 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import summarize
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import flaskr
+from benchmarks.common import make_app
+imported = time.perf_counter()
+app = make_app(sys.argv[1])
+created = time.perf_counter()
+client = app.test_client()
+client.set_cookie('access_token_cookie', sys.argv[2])
+assert client.get('/').status_code == 200
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first request': served - created,
+    'total': served - start,
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def seed(db_path):
+    from flask_jwt_extended import create_access_token
+    from flaskr.database import db
+    from flaskr.models import Post, User
+
+    from benchmarks.common import make_app
+
+    app = make_app(db_path)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', password='')
+        db.session.add(user)
+        db.session.add_all(Post(title=f'post {i}', body='', author=user, likes=0) for i in range(20))
+        db.session.commit()
+        return create_access_token(identity=user)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        token = seed(db_path)
+        runs = [
+            json.loads(subprocess.run([sys.executable, '-c', CHILD, db_path, token],
+                                      capture_output=True, check=True, text=True).stdout)
+            for _ in range(args.repeat)
+        ]
+
+    print(f"{'phase':>14} {'p50 ms':>9} {'p95 ms':>9}")
+    for phase in ('import', 'create_app', 'first request', 'total'):
+        stats = summarize([run[phase] for run in runs])
+        print(f"{phase:>14} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f}")
+    print(f"{'modules':>14} {runs[0]['modules']:>9}")
+
+
+if __name__ == '__main__':
+    main()
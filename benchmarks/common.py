@@ -0,0 +1,48 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks are plain scripts run from the repository root, e.g.
+
+    python -m benchmarks.bench_search --sizes 10000 100000
+
+They build their own SQLite file in a temporary directory and never touch
+the instance database.
+"""
+import statistics
+import time
+
+from flaskr import create_app
+from flaskr.config import TestingConfig, config
+
+
+def make_app(db_path, **settings):
+    """An app bound to the SQLite file at ``db_path``, extra config in ``settings``."""
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        **settings,
+    })
+    return create_app(config_mode='benchmark')
+
+
+def timings(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples):
+    """p50/p95/p99 and mean of ``samples`` in milliseconds."""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+    }
@@ -0,0 +1,266 @@
+"""Latency and throughput of the hot endpoints, saved as JSON.
+
+Seeds a fresh SQLite database, then times feed views, like toggles,
+post creation and updates, logins and the tag page, either through the
+WSGI test client or, with --server, over HTTP against a local server.
+Every scenario reports requests per second and p50/p95/p99.
+
+    python -m benchmarks.run --posts 10000 --output before.json
+    python -m benchmarks.run --posts 10000 --compare before.json --threshold 10
+
+With --compare the run fails (exit status 1) when a scenario's p95 grew,
+or its throughput dropped, by more than --threshold percent.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from flaskr.commands import seed_command
+from flaskr.database import db
+from flaskr.models import Post
+
+from benchmarks.common import make_app, summarize
+
+PASSWORD = 'bench'
+
+
+def seed(app, posts, users, tags, seed_value):
+    with app.app_context():
+        db.create_all()
+    result = app.test_cli_runner().invoke(seed_command, [
+        '--posts', str(posts), '--users', str(users), '--tags', str(tags),
+        '--seed', str(seed_value), '--password', PASSWORD,
+    ])
+    if result.exit_code:
+        raise SystemExit(result.output)
+
+
+class ClientDriver:
+    """Requests through the WSGI test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data=None):
+        return self.client.post(path, data=data).status_code
+
+
+class ServerDriver:
+    """Requests over HTTP, with cookies kept like a browser would."""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def get(self, path):
+        return self.session.get(self.base_url + path, allow_redirects=False).status_code
+
+    def post(self, path, data=None):
+        return self.session.post(self.base_url + path, data=data, allow_redirects=False).status_code
+
+
+class Worker:
+    """One logged in user running scenarios on its own driver."""
+
+    def __init__(self, driver, user_id, own_posts, posts, rng):
+        self.driver = driver
+        self.user_id = user_id
+        self.own_posts = own_posts
+        self.posts = posts
+        self.rng = rng
+        self.login()
+
+    def login(self):
+        return self.driver.post('/auth/login', {
+            'username': f'user{self.user_id}', 'password': PASSWORD,
+        })
+
+    def feed(self):
+        return self.driver.get('/')
+
+    def like(self):
+        return self.driver.post(f'/{self.rng.randint(1, self.posts)}/like')
+
+    def create(self):
+        return self.driver.post('/create', {'title': 'benchmark', 'body': 'lorem ipsum ' * 20})
+
+    def update(self):
+        post_id = self.rng.choice(self.own_posts)
+        return self.driver.post(f'/{post_id}/update', {
+            'title': f'updated {self.rng.random()}', 'body': 'lorem ipsum ' * 20,
+        })
+
+    def tags(self):
+        return self.driver.get('/tags')
+
+
+# scenario -> status codes that count as success
+SCENARIOS = {
+    'feed': {200},
+    'like': {302},
+    'create': {302},
+    'update': {302},
+    'login': {302},
+    'tags': {200},
+}
+
+
+def run_scenario(workers, name, requests, warmup):
+    expected = SCENARIOS[name]
+    samples = []
+    errors = []
+    lock = threading.Lock()
+
+    def loop(worker, count, record):
+        action = getattr(worker, name)
+        for _ in range(count):
+            start = time.perf_counter()
+            status = action()
+            elapsed = time.perf_counter() - start
+            if record:
+                with lock:
+                    (samples if status in expected else errors).append(elapsed)
+
+    for worker in workers:
+        loop(worker, warmup, record=False)
+    threads = [
+        threading.Thread(target=loop, args=(worker, requests // len(workers), True))
+        for worker in workers
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    stats = summarize(samples) if samples else {'count': 0}
+    stats['rps'] = len(samples) / wall
+    stats['errors'] = len(errors)
+    return stats
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+    # one access log line per request would dominate the timings
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Regressions of ``results`` against ``baseline`` beyond ``threshold`` percent."""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not before or not stats.get('count') or not before.get('count'):
+            continue
+        p95 = (stats['p95_ms'] / before['p95_ms'] - 1) * 100
+        rps = (1 - stats['rps'] / before['rps']) * 100
+        print(f"{name:>8}  p95 {before['p95_ms']:8.2f} -> {stats['p95_ms']:8.2f} ms ({p95:+.1f}%)"
+              f"  rps {before['rps']:8.1f} -> {stats['rps']:8.1f} ({-rps:+.1f}%)")
+        if p95 > threshold:
+            regressions.append(f'{name}: p95 {p95:+.1f}%')
+        if rps > threshold:
+            regressions.append(f'{name}: throughput {-rps:+.1f}%')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=300, help='Timed requests per scenario.')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per scenario and client.')
+    parser.add_argument('--clients', type=int, default=1, help='Concurrent logged in clients.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--server', action='store_true', help='Go through a local HTTP server.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Baseline JSON file from an earlier run.')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed regression in percent.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # TESTING off so the server mode behaves like production on errors
+        app = make_app(os.path.join(tmp, 'bench.db'), TESTING=False)
+        seed(app, args.posts, args.users, args.tags, args.seed)
+        with app.app_context():
+            authors = db.session.execute(db.select(Post.author_id, Post.id)).all()
+        own_posts = {}
+        for author_id, post_id in authors:
+            own_posts.setdefault(author_id, []).append(post_id)
+
+        server = serve(app) if args.server else None
+        workers = []
+        for i in range(args.clients):
+            user_id = 1 + i % args.users
+            if server:
+                driver = ServerDriver(f'http://127.0.0.1:{server.server_port}')
+            else:
+                driver = ClientDriver(app)
+            workers.append(Worker(driver, user_id, own_posts.get(user_id) or [1],
+                                  args.posts, random.Random(args.seed + i)))
+
+        results = {}
+        print(f"{'scenario':>8} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for name in args.scenarios:
+            stats = results[name] = run_scenario(workers, name, args.requests, args.warmup)
+            print(f"{name:>8} {stats['rps']:>8.1f} {stats.get('p50_ms', 0):>8.2f} "
+                  f"{stats.get('p95_ms', 0):>8.2f} {stats.get('p99_ms', 0):>8.2f} {stats['errors']:>6}")
+        if server:
+            server.shutdown()
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'mode': 'server' if args.server else 'client',
+            'posts': args.posts, 'users': args.users, 'tags': args.tags,
+            'requests': args.requests, 'clients': args.clients,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        setup = ('mode', 'posts', 'users', 'tags', 'clients')
+        differs = [key for key in setup if baseline['meta'].get(key) != report['meta'][key]]
+        if differs:
+            print(f"Warning: the baseline was run with a different {', '.join(differs)}.")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:g}%: " + '; '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
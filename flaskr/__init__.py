@@ -1,18 +1,25 @@
 from flask import Flask
 from .config import config
-from flaskr import database
-from flaskr.models import User, Post
+from flaskr import database, instrumentation
 
 
 def create_app(config_mode='development'):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(config[config_mode])
     database.init_app(app)
+    instrumentation.init_app(app)
+    from . import commands
+    commands.init_app(app)
 
     from . import auth
     app.register_blueprint(auth.bp)
     from . import blog
     app.register_blueprint(blog.bp)
+    from . import api
+    app.register_blueprint(api.bp)
+    if app.config['METRICS_ENABLED']:
+        from . import metrics
+        app.register_blueprint(metrics.bp)
 
     app.add_url_rule('/', endpoint='index')
 
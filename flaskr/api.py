@@ -0,0 +1,87 @@
+import json
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+
+from flaskr.conditional import conditional
+from flaskr.database import db
+from flaskr.models import Post, Tags, User, tags_post
+from flaskr.pagination import paginate
+from flaskr.queries import aggregate_list, split_list
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_PAGE_SIZE = 100
+
+
+def _tag_names():
+    return (
+        db.select(aggregate_list(Tags.name))
+        .join(tags_post, tags_post.c.tag_id == Tags.id)
+        .where(tags_post.c.post_id == Post.id)
+        .scalar_subquery()
+    )
+
+
+# field name -> column expression; only the requested ones are selected
+POST_FIELDS = {
+    'id': lambda: Post.id,
+    'title': lambda: Post.title,
+    'created': lambda: Post.created,
+    'likes': lambda: Post.likes,
+    'author': lambda: User.username,
+    'tags': _tag_names,
+}
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), default=lambda value: value.isoformat()).encode()
+
+
+@bp.route('/posts', methods=['GET'])
+@jwt_required()
+@conditional()
+def posts():
+    """Page of the feed as JSON rows, newest first.
+
+    ``fields`` picks a comma separated subset of POST_FIELDS, ``limit``
+    the page size and ``older``/``newer`` take the cursors of a previous
+    response. Only the chosen columns are selected, as plain rows.
+    """
+    requested = request.args.get('fields')
+    fields = requested.split(',') if requested else list(POST_FIELDS)
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    limit = request.args.get('limit', current_app.config['FEED_PAGE_SIZE'], type=int)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    # the cursor columns are always selected, under names the rows can't clash with
+    columns = [POST_FIELDS[field]().label(field) for field in fields]
+    columns += [Post.created.label('cursor_created'), Post.id.label('cursor_id')]
+    stmt = db.select(*columns)
+    if 'author' in fields:
+        stmt = stmt.join(User, User.id == Post.author_id)
+    keys = (Post.created, Post.id)
+    page = paginate(db.session, stmt, keys, limit,
+                    older=request.args.get('older'), newer=request.args.get('newer'),
+                    scalars=False, key_names=('cursor_created', 'cursor_id'))
+
+    likes = current_app.extensions.get('like_buffer')
+    rows = []
+    for row in page.items:
+        item = {field: row._mapping[field] for field in fields}
+        if 'tags' in item:
+            item['tags'] = split_list(item['tags'])
+        if 'likes' in item and likes is not None:
+            item['likes'] += likes.pending(row.cursor_id)
+        rows.append(item)
+    body = dumps({'posts': rows, 'older': page.older, 'newer': page.newer})
+    return current_app.response_class(body, mimetype='application/json')
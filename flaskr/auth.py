@@ -1,16 +1,20 @@
 from flaskr.database import db, jwt
-from datetime import datetime, timezone, timedelta
-from sqlalchemy import select
-import requests
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
 
 from flask import (
-    Blueprint, flash, redirect, render_template, request, url_for, make_response, jsonify
+    Blueprint, current_app, flash, g, has_app_context, redirect, render_template, request, url_for, make_response, jsonify
 )
 from flask import request
 from flask_jwt_extended import (
-    get_jwt, set_access_cookies, unset_jwt_cookies, jwt_required, create_access_token, jwt_required, get_jwt, current_user, create_refresh_token
+    get_jwt, set_access_cookies, set_refresh_cookies, unset_jwt_cookies, jwt_required, create_access_token, jwt_required, get_jwt, current_user, create_refresh_token
 )
 from werkzeug.security import check_password_hash, generate_password_hash
+from flaskr.cache import TTLCache
+from flaskr.instrumentation import timed
 from flaskr.models import User
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -20,14 +24,45 @@ bp = Blueprint('auth', __name__, url_prefix='/auth')
 def user_identity_lookup(user):
     return user.id
 
+@bp.record_once
+def init_identity_cache(state):
+    state.app.extensions['identity_cache'] = TTLCache(
+        maxsize=state.app.config['IDENTITY_CACHE_SIZE'],
+        ttl=state.app.config['IDENTITY_CACHE_TTL'],
+    )
+
 @jwt.user_lookup_loader
 def user_lookup_callback(_jwt_header, jwt_data):
-    print(jwt_data)
-    identity = jwt_data["sub"]
-    return User.query.filter_by(id=identity).one_or_none()
+    with timed('jwt'):
+        return load_identity(jwt_data["sub"])
+
+def load_identity(identity):
+    cache = current_app.extensions['identity_cache']
+    cached = cache.get(str(identity))
+    if cached is not None:
+        # attach a copy to this request's session without a SELECT
+        return db.session.merge(cached, load=False)
+
+    user = User.query.filter_by(id=identity).one_or_none()
+    if user is not None:
+        detached = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+        make_transient_to_detached(detached)
+        cache.set(str(identity), detached)
+    return user
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_identity(mapper, connection, target):
+    if has_app_context() and 'identity_cache' in current_app.extensions:
+        current_app.extensions['identity_cache'].invalidate(str(target.id))
 ###########################################
 @jwt.expired_token_loader
-def expired_token_callback(jwt_header, error):
+def expired_token_callback(jwt_header, jwt_data):
+    if jwt_data['type'] == 'access':
+        # the refresh cookie is scoped to /auth/refresh, so let that view
+        # decide; a form post can't be replayed through a redirect
+        next_url = request.full_path.rstrip('?') if request.method == 'GET' else url_for('index')
+        return redirect(url_for('auth.refresh', next=next_url))
     return redirect(url_for('auth.login'))
 
 @jwt.invalid_token_loader
@@ -39,20 +74,60 @@ def missing_token_callback(error):
     return redirect(url_for('auth.login'))
 ###########################################
 
+@bp.record_once
+def init_token_stats(state):
+    state.app.extensions['token_stats'] = Counter()
+
+def mint_tokens(response, user, refresh=False):
+    """Sign a new access token, and a refresh token when asked, into cookies.
+
+    Every signature is counted per request in ``g.tokens_minted`` and per
+    process in ``app.extensions['token_stats']``.
+    """
+    stats = current_app.extensions['token_stats']
+    set_access_cookies(response, create_access_token(identity=user))
+    stats['access'] += 1
+    minted = 1
+    if refresh:
+        set_refresh_cookies(response, create_refresh_token(identity=user))
+        stats['refresh'] += 1
+        minted += 1
+    g.tokens_minted = g.get('tokens_minted', 0) + minted
+    return response
+
 @bp.after_app_request
 def refresh_expiring_jwts(response):
+    current_app.extensions['token_stats']['requests'] += 1
     try:
-        exp_timestamp = get_jwt()["exp"]
+        jwt_data = get_jwt()
+        if jwt_data["type"] != "access":
+            return response
         now = datetime.now(timezone.utc)
-        target_timestamp = datetime.timestamp(now + timedelta(hours=1))
-        if target_timestamp > exp_timestamp:
-            access_token = create_access_token(identity=current_user, expires_delta=timedelta(minutes=10))
-            set_access_cookies(response, access_token)
+        threshold = current_app.config['JWT_ACCESS_REFRESH_THRESHOLD']
+        if datetime.timestamp(now + threshold) > jwt_data["exp"]:
+            mint_tokens(response, current_user)
         return response
     except (RuntimeError, KeyError):
         # Case where there is not a valid JWT. Just return the original response
         return response
 
+def is_local_url(url):
+    # browsers drop tabs and newlines and read a backslash as a slash, so
+    # "/\t/evil.example" or "/\\evil.example" would leave the site
+    if any(ord(char) < 0x20 or ord(char) == 0x7f or char == '\\' for char in url):
+        return False
+    parts = urlsplit(url)
+    return (not parts.scheme and not parts.netloc
+            and url.startswith('/') and not url.startswith('//'))
+
+@bp.route('/refresh')
+@jwt_required(refresh=True)
+def refresh():
+    next_url = request.args.get('next', '')
+    if not is_local_url(next_url):
+        next_url = url_for('index')
+    return mint_tokens(make_response(redirect(next_url)), current_user)
+
 @bp.route('/register', methods=('GET', 'POST'))
 def register():
     if request.method == 'POST':
@@ -92,10 +167,8 @@ def login():
             error = 'Incorrect password.'
 
         if error is None:
-            access_token = create_access_token(identity=user, expires_delta=timedelta(seconds=10))
             response = make_response(redirect(url_for('index')))
-            response.set_cookie('access_token_cookie', access_token, httponly=True)
-            return response
+            return mint_tokens(response, user, refresh=True)
         flash(error)
 
     return render_template('auth/login.html')
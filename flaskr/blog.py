@@ -1,28 +1,158 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
 from flask import (
-    Blueprint, flash, jsonify, redirect, render_template, request, url_for
+    Blueprint, Response, current_app, flash, get_template_attribute, jsonify, redirect, render_template, request,
+    stream_with_context, url_for
 )
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.exceptions import abort
-from flaskr.models import User, Post, LikedPosts, Tags
-from flaskr.database import db
+from flaskr.models import User, Post, LikedPosts, Tags, tags_post
+from flaskr.cache import TTLCache
+from flaskr.conditional import bump_content_version, conditional
+from flaskr.database import db, insert_ignore
+from flaskr.likes import LikeBuffer
+from flaskr.pagination import paginate
+from flaskr.search import search_available, search_posts
+from flaskr.queries import (
+    feed_options, post_options, liked_post_ids, iter_post_records, adjust_tag_counts, top_posts_by_tag,
+    shifted_score,
+)
 from flask_jwt_extended import current_user, jwt_required
 
 bp = Blueprint('blog', __name__)
 
-@bp.route('/')
-@jwt_required()
-def index():
-    stmt = db.select(Post).order_by(Post.created.desc())
-    posts = db.session.execute(stmt).scalars().all()
-    liked_posts_ids = []
+PostFragment = namedtuple('PostFragment', 'head tail')
+
+@bp.record_once
+def init_fragment_cache(state):
+    state.app.extensions['fragment_cache'] = TTLCache(
+        maxsize=state.app.config['FRAGMENT_CACHE_SIZE'],
+    )
+
+@bp.record_once
+def init_like_buffer(state):
+    if state.app.config['LIKES_WRITE_BEHIND']:
+        state.app.extensions['like_buffer'] = LikeBuffer(
+            flush_interval=state.app.config['LIKES_FLUSH_INTERVAL'],
+            flush_size=state.app.config['LIKES_FLUSH_SIZE'],
+        )
+        atexit.register(flush_likes_at_exit, state.app)
+
+def flush_like_buffer(buffer):
+    try:
+        with db.engine.connect() as conn:
+            buffer.flush(conn)
+    except SQLAlchemyError:
+        # kept in the buffer, the next flush retries them
+        current_app.logger.exception('Flushing %d pending like counts failed', len(buffer))
+
+@bp.after_app_request
+def flush_pending_likes(response):
+    buffer = current_app.extensions.get('like_buffer')
+    if buffer is not None and buffer.due():
+        flush_like_buffer(buffer)
+    return response
+
+_flusher_lock = threading.Lock()
+
+def start_like_flusher(buffer):
+    """Flush ``buffer`` from a daemon thread once it's due, idle or not.
+
+    Started by the first buffered like rather than in create_app, a thread
+    started before a preloading server forks would not run in the workers.
+    """
+    app = current_app._get_current_object()
+    pid = os.getpid()
+    with _flusher_lock:
+        if app.extensions.get('like_flusher') == pid:
+            return
+        app.extensions['like_flusher'] = pid
+
+    def run():
+        while True:
+            time.sleep(buffer.flush_interval)
+            if buffer.due():
+                with app.app_context():
+                    flush_like_buffer(buffer)
+
+    threading.Thread(target=run, name='like-flusher', daemon=True).start()
+
+def flush_likes_at_exit(app):
+    with app.app_context():
+        flush_like_buffer(app.extensions['like_buffer'])
+
+@bp.app_template_filter('like_count')
+def like_count(post):
+    """``post.likes`` plus this process's likes that aren't flushed yet."""
+    buffer = current_app.extensions.get('like_buffer')
+    return post.likes + (buffer.pending(post.id) if buffer is not None else 0)
+
+def post_fragments(posts):
+    """Rendered markup of each post, keyed by post id.
+
+    Fragments are cached per post together with the post's version, a
+    bumped version re-renders the post on the next hit. Post ids are
+    never reused, so a fragment of a post deleted through another worker
+    can't be served for a new one. Likes and the viewer's actions are
+    not part of the fragment.
+    """
+    cache = current_app.extensions['fragment_cache']
+    head = get_template_attribute('blog/_post.html', 'head')
+    tail = get_template_attribute('blog/_post.html', 'tail')
+    fragments = {}
+    for post in posts:
+        cached = cache.get(post.id)
+        if cached is None or cached[0] != post.version:
+            cached = (post.version, PostFragment(head(post), tail(post)))
+            cache.set(post.id, cached)
+        fragments[post.id] = cached[1]
+    return fragments
+
+def render_feed(stmt, keys=(Post.created, Post.id), key_names=None, **context):
+    """Render a page of ``stmt``'s posts, highest ``keys`` first, with the feed template."""
+    page = paginate(db.session, stmt.options(*feed_options), keys,
+                    current_app.config['FEED_PAGE_SIZE'],
+                    older=request.args.get('older'), newer=request.args.get('newer'),
+                    key_names=key_names)
+    posts = page.items
+    liked_posts_ids = set()
     user_id = current_user.id if current_user else None
     username = current_user.username if current_user else None
     if user_id:
-        user = User.query.get(user_id)
-        if not user:
-            return render_template('error.html', message="User not found"), 404
-        liked_posts_ids = [liked.post_id for liked in user.liked_posts]
+        liked_posts_ids = liked_post_ids(user_id, [post.id for post in posts])
     return render_template('blog/index.html', posts=posts, liked_posts=liked_posts_ids, 
-                           id=user_id, username=username)
+                           id=user_id, username=username, page=page,
+                           fragments=post_fragments(posts), **context)
+
+@bp.route('/')
+@jwt_required()
+@conditional(per_viewer=True)
+def index():
+    return render_feed(db.select(Post))
+
+@bp.route('/trending')
+@jwt_required()
+@conditional(per_viewer=True)
+def trending():
+    return render_feed(db.select(Post), keys=(Post.score, Post.id), trending=True)
+
+@bp.route('/me/likes')
+@jwt_required()
+@conditional(per_viewer=True)
+def my_likes():
+    # newest post first, walks the (user_id, post_id) primary key
+    stmt = (
+        db.select(Post)
+        .join(LikedPosts, LikedPosts.post_id == Post.id)
+        .where(LikedPosts.user_id == current_user.id)
+    )
+    return render_feed(stmt, keys=(LikedPosts.post_id,), key_names=('id',), liked=True)
 
 @bp.route('/create', methods=('GET', 'POST'))
 @jwt_required()
@@ -39,17 +169,18 @@ def create():
             flash(error)
         else:
             post = Post(title=title, body=body, author_id=current_user.id)
-            for tag_id in selected_tags:
-                tag = Tags.query.get(tag_id)
-                if tag:
-                    post.tags.append(tag)
+            if selected_tags:
+                stmt = db.select(Tags).where(Tags.id.in_(selected_tags))
+                post.tags = db.session.execute(stmt).scalars().all()
             db.session.add(post)
+            adjust_tag_counts({tag.id: 1 for tag in post.tags})
+            bump_content_version()
             db.session.commit()
             return redirect(url_for('blog.index'))
     return render_template('blog/create.html', tags=tags)
 
 def get_post(id, check_author=True):
-    stmt = db.select(Post).join(User, Post.author_id == User.id).where(Post.id == id)
+    stmt = db.select(Post).options(*post_options).where(Post.id == id)
     post = db.session.execute(stmt).scalar()
     if post is None:
         abort(404, f"Post id {id} doesn't exist.")
@@ -57,6 +188,25 @@ def get_post(id, check_author=True):
         flash("You don't have permission to update this post.")
     return post
 
+@bp.route('/<int:id>/likers')
+@jwt_required()
+@conditional(per_viewer=True)
+def likers(id):
+    post = db.session.execute(db.select(Post.id, Post.title).where(Post.id == id)).first()
+    if post is None:
+        abort(404, f"Post id {id} doesn't exist.")
+    # walks ix_liked_posts_post_id_user_id instead of loading post.liked_posts
+    stmt = (
+        db.select(User.id, User.username)
+        .join(LikedPosts, LikedPosts.user_id == User.id)
+        .where(LikedPosts.post_id == id)
+    )
+    page = paginate(db.session, stmt, (LikedPosts.user_id,), current_app.config['FEED_PAGE_SIZE'],
+                    older=request.args.get('older'), newer=request.args.get('newer'),
+                    scalars=False, key_names=('id',))
+    return render_template('blog/likers.html', post=post, users=page.items, page=page,
+                           id=current_user.id, username=current_user.username)
+
 @bp.route('/<int:id>/update', methods=('GET', 'POST'))
 @jwt_required()
 def update(id):
@@ -80,9 +230,17 @@ def update(id):
         else:
             post.title = title
             post.body = body
+            old_tags = {tag.id for tag in post.tags}
             stmt = db.select(Tags).where(Tags.id.in_(selected_tags))
             post.tags = db.session.execute(stmt).scalars().all()
+            new_tags = {tag.id for tag in post.tags}
+            changes = {tag_id: 1 for tag_id in new_tags - old_tags}
+            changes.update({tag_id: -1 for tag_id in old_tags - new_tags})
+            adjust_tag_counts(changes)
+            post.version = Post.version + 1
+            bump_content_version()
             db.session.commit()
+            current_app.extensions['fragment_cache'].invalidate(id)
             return redirect(url_for('blog.index'))
 
     return render_template('blog/update.html', post=post, tags=tags, selected_tags=selected_tags)
@@ -91,10 +249,66 @@ def update(id):
 @jwt_required()
 def delete(id):
     post = get_post(id)
+    adjust_tag_counts({tag.id: -1 for tag in post.tags})
     db.session.delete(post)
+    bump_content_version()
     db.session.commit()
+    current_app.extensions['fragment_cache'].invalidate(id)
     return redirect(url_for('blog.index'))
 
+def toggle_like(user_id, post_id):
+    """Like or unlike a post in a single transaction.
+
+    The DELETE/INSERT on liked_posts decides the direction from the row
+    count, and the counter moves with ``likes = likes + delta`` in SQL, so
+    concurrent clicks can neither lose an update nor hit the primary key.
+    With the like buffer the counter change is queued for a batched write
+    instead. Returns the change applied to the counter, or None when the
+    post doesn't exist.
+    """
+    buffer = current_app.extensions.get('like_buffer')
+    if buffer is not None:
+        # no UPDATE tells whether the post exists, ask before writing
+        if db.session.execute(db.select(Post.id).where(Post.id == post_id)).first() is None:
+            return None
+    unliked = db.session.execute(
+        db.delete(LikedPosts)
+        .where(LikedPosts.user_id == user_id, LikedPosts.post_id == post_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if unliked:
+        delta = -1
+    else:
+        try:
+            liked = db.session.execute(
+                insert_ignore(LikedPosts).values(user_id=user_id, post_id=post_id)
+            ).rowcount
+        except IntegrityError:
+            # foreign key enforced: the post is gone
+            db.session.rollback()
+            return None
+        delta = 1 if liked else 0
+
+    if buffer is not None:
+        db.session.commit()
+        buffer.add(post_id, delta)
+        start_like_flusher(buffer)
+        return delta
+
+    updated = db.session.execute(
+        db.update(Post)
+        .where(Post.id == post_id)
+        .values(likes=Post.likes + delta, score=shifted_score(Post.score, delta))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        db.session.rollback()
+        return None
+    if delta:
+        bump_content_version()
+    db.session.commit()
+    return delta
+
 @bp.route('/<postid>/like', methods=['POST'])
 @jwt_required()
 def like(postid):
@@ -103,24 +317,10 @@ def like(postid):
     except ValueError:
         return jsonify({'error': 'Post ID must be integers'}), 400
     user = current_user
-    post = Post.query.get(postid)
     if user is None:
         return jsonify({'error': "User doesn't exist"}), 404
-    if post is None:
+    if toggle_like(user.id, postid) is None:
         return jsonify({'error': "Post doesn't exist"}), 404
-    
-    userid = user.id
-    stmt = db.select(LikedPosts).where(LikedPosts.user_id == userid, LikedPosts.post_id == postid)
-    liked_post = db.session.execute(stmt).scalar()
-    if liked_post is None:
-        post.likes += 1
-        new_like = LikedPosts(user_id=userid, post_id=postid)
-        db.session.add(new_like)
-    else:
-        post.likes -= 1
-        db.session.delete(liked_post)
-
-    db.session.commit()
     return redirect(url_for('blog.index'))
 
 @bp.route('/add-tag', methods=['POST'])
@@ -138,11 +338,66 @@ def add_tag():
 
     new_tag = Tags(name=tag_name)
     db.session.add(new_tag)
+    bump_content_version()
     db.session.commit()
 
     return jsonify({'success': True, 'tagId': new_tag.id, 'tagName': new_tag.name}), 201
 
 @bp.route('/tags', methods=['GET'])
+@conditional()
 def get_tags():
-    tags = db.session.execute(db.select(Tags)).scalars().all()
-    return render_template('blog/tag.html', tags=tags)
+    order = 'liked' if request.args.get('sort') == 'liked' else 'recent'
+    tags = db.session.execute(db.select(Tags).order_by(Tags.name)).scalars().all()
+    top_posts = top_posts_by_tag(current_app.config['TAGS_TOP_POSTS'], order)
+    return render_template('blog/tag.html', tags=tags, top_posts=top_posts, order=order)
+
+@bp.route('/tags/<name>', methods=['GET'])
+@jwt_required()
+@conditional(per_viewer=True)
+def tag_feed(name):
+    tag = db.session.execute(db.select(Tags).where(Tags.name == name)).scalar()
+    if tag is None:
+        abort(404, f"Tag {name} doesn't exist.")
+    # newest post first by id, so the (tag_id, post_id) index gives the
+    # order too and a page reads only its own rows
+    stmt = (
+        db.select(Post)
+        .join(tags_post, tags_post.c.post_id == Post.id)
+        .where(tags_post.c.tag_id == tag.id)
+    )
+    return render_feed(stmt, keys=(tags_post.c.post_id,), key_names=('id',), tag=tag)
+
+def _search_args():
+    if not search_available():
+        abort(501, "Search needs the SQLite FTS5 index.")
+    text = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    posts, has_more = search_posts(text, page, current_app.config['FEED_PAGE_SIZE'])
+    return text, page, posts, has_more
+
+@bp.route('/search', methods=['GET'])
+@jwt_required()
+def search():
+    text, page, posts, has_more = _search_args()
+    return render_template('blog/search.html', posts=posts, q=text, page=page,
+                           has_more=has_more, username=current_user.username)
+
+@bp.route('/search.json', methods=['GET'])
+@jwt_required()
+def search_json():
+    text, page, posts, has_more = _search_args()
+    results = [
+        {'id': post.id, 'title': post.title, 'body': post.body, 'author': post.author.username,
+         'created': post.created.isoformat(), 'likes': post.likes}
+        for post in posts
+    ]
+    return jsonify({'query': text, 'page': page, 'results': results,
+                    'next_page': page + 1 if has_more else None})
+
+@bp.route('/export.ndjson', methods=['GET'])
+@jwt_required()
+def export():
+    def generate():
+        for record in iter_post_records():
+            yield json.dumps(record) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
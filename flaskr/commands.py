@@ -0,0 +1,398 @@
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, time as clock, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from flaskr.conditional import bump_content_version
+from flaskr.database import db, insert_ignore
+from flaskr.models import LikedPosts, Post, ScoreDecay, Tags, User, tags_post
+from flaskr.queries import adjust_tag_counts, iter_post_records
+
+
+def _batches(lines, size):
+    lines = iter(lines)
+    while True:
+        batch = list(itertools.islice(lines, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _resolve_tags(conn, names, tag_ids):
+    """Fill ``tag_ids`` with ids for ``names``, creating the missing tags."""
+    missing = [name for name in names if name not in tag_ids]
+    if not missing:
+        return
+    conn.execute(insert_ignore(Tags.__table__, bind=conn), [{'name': name} for name in missing])
+    stmt = db.select(Tags.id, Tags.name).where(Tags.name.in_(missing))
+    tag_ids.update((name, id) for id, name in conn.execute(stmt))
+
+
+def _check_record(record):
+    """Raise ValueError unless ``record`` is a post import-posts can insert."""
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+    for name, kind in (('title', str), ('author_id', int)):
+        if name not in record:
+            raise ValueError(f"missing {name}")
+        if not isinstance(record[name], kind) or isinstance(record[name], bool):
+            raise ValueError(f"{name} must be {kind.__name__}")
+    for name, kind in (('body', str), ('likes', int), ('created', str)):
+        if record.get(name) is not None and not isinstance(record[name], kind):
+            raise ValueError(f"{name} must be {kind.__name__}")
+    for name, kind in (('tags', str), ('liked_by', int)):
+        values = record.get(name, [])
+        if not isinstance(values, list) or not all(isinstance(v, kind) for v in values):
+            raise ValueError(f"{name} must be a list of {kind.__name__}")
+    if record.get('created'):
+        datetime.fromisoformat(record['created'])
+    return record
+
+
+def _unknown_user(conn, records):
+    """Line and id of the first user ``records`` name that doesn't exist, or None."""
+    def users(record):
+        return (record['author_id'], *record.get('liked_by', ()))
+
+    wanted = {user_id for _, record in records for user_id in users(record)}
+    known = set()
+    # in chunks, a batch can name more users than SQLite takes parameters
+    for chunk in _batches(wanted, 500):
+        known.update(conn.execute(db.select(User.id).where(User.id.in_(chunk))).scalars())
+    for line, record in records:
+        for user_id in users(record):
+            if user_id not in known:
+                return line, user_id
+    return None
+
+
+def _abort(conn, message):
+    conn.rollback()
+    raise click.ClickException(f"{message}. Earlier transactions were kept.")
+
+
+@click.command('import-posts')
+@click.argument('source', type=click.File('r'))
+@click.option('--batch-size', default=1000, show_default=True, help='Posts per INSERT batch.')
+@click.option('--commit-every', default=10, show_default=True, help='Batches per transaction.')
+@with_appcontext
+def import_posts_command(source, batch_size, commit_every):
+    """Import posts from a JSON lines file ('-' reads stdin).
+
+    Each line is an object with title, body and author_id, and optionally
+    created (ISO 8601), likes, tags (names) and liked_by (user ids). Lines
+    are streamed in batches, so memory use doesn't grow with the file.
+    An invalid line stops the import and rolls back the open transaction;
+    the error names its batch and line.
+    """
+    post_table = Post.__table__
+    insert_posts = db.insert(post_table).returning(post_table.c.id, sort_by_parameter_order=True)
+    # tag names seen so far; bounded by the tag vocabulary, not the file
+    tag_ids = {}
+    counts = {'posts': 0, 'tags': 0, 'likes': 0}
+    half_life = current_app.config['TRENDING_HALF_LIFE'].total_seconds()
+    score_floor = current_app.config['TRENDING_SCORE_FLOOR']
+    start = time.perf_counter()
+
+    with db.engine.connect() as conn:
+        for number, batch in enumerate(_batches(enumerate(source, start=1), batch_size), start=1):
+            records = []
+            for line, text in batch:
+                if not text.strip():
+                    continue
+                try:
+                    records.append((line, _check_record(json.loads(text))))
+                except json.JSONDecodeError as e:
+                    _abort(conn, f"Invalid JSON in batch {number}, line {line}: {e}")
+                except ValueError as e:
+                    _abort(conn, f"Invalid record in batch {number}, line {line}: {e}")
+            if not records:
+                continue
+            unknown = _unknown_user(conn, records)
+            if unknown:
+                _abort(conn, f"Invalid record in batch {number}, line {unknown[0]}: "
+                             f"no user with id {unknown[1]}")
+
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            rows = []
+            for _, record in records:
+                liked_by = set(record.get('liked_by', ()))
+                created = datetime.fromisoformat(record['created']) if record.get('created') else now
+                if created.tzinfo is not None:
+                    created = created.astimezone(timezone.utc).replace(tzinfo=None)
+                like_count = record.get('likes', len(liked_by))
+                rows.append({
+                    'title': record['title'],
+                    'body': record.get('body', ''),
+                    'author_id': record['author_id'],
+                    'created': created,
+                    'likes': like_count,
+                    'score': _initial_score(like_count, (now - created).total_seconds(),
+                                            half_life, score_floor),
+                })
+
+            try:
+                _resolve_tags(conn, {name for _, r in records for name in r.get('tags', ())}, tag_ids)
+                post_ids = conn.execute(insert_posts, rows).scalars().all()
+
+                links = [{'post_id': post_id, 'tag_id': tag_ids[name]}
+                         for post_id, (_, record) in zip(post_ids, records)
+                         for name in set(record.get('tags', ()))]
+                if links:
+                    conn.execute(db.insert(tags_post), links)
+                    adjust_tag_counts(Counter(link['tag_id'] for link in links), bind=conn)
+                likes = [{'post_id': post_id, 'user_id': user_id}
+                         for post_id, (_, record) in zip(post_ids, records)
+                         for user_id in set(record.get('liked_by', ()))]
+                if likes:
+                    conn.execute(insert_ignore(LikedPosts.__table__, bind=conn), likes)
+            except IntegrityError as e:
+                _abort(conn, f"Could not insert batch {number}, lines "
+                             f"{batch[0][0]}-{batch[-1][0]}: {e.orig}")
+
+            counts['posts'] += len(rows)
+            counts['tags'] += len(links)
+            counts['likes'] += len(likes)
+            if number % commit_every == 0:
+                conn.commit()
+        conn.commit()
+
+    bump_content_version()
+    db.session.commit()
+
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    click.echo(
+        f"Imported {counts['posts']} posts, {counts['tags']} tag links and "
+        f"{counts['likes']} likes in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)."
+    )
+
+
+@click.command('export-posts')
+@click.argument('target', type=click.File('w'), default='-')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+@with_appcontext
+def export_posts_command(target, batch_size):
+    """Write every post as JSON lines ('-' or no argument writes stdout).
+
+    The output is the format import-posts reads, plus each post's id.
+    """
+    start = time.perf_counter()
+    count = 0
+    for record in iter_post_records(batch_size):
+        target.write(json.dumps(record) + '\n')
+        count += 1
+    elapsed = time.perf_counter() - start
+    click.echo(f"Exported {count} posts in {elapsed:.1f}s.", err=True)
+
+
+def _initial_score(likes, age, half_life, floor):
+    """Trending score of a post ``age`` seconds old, as if every like had come in with it."""
+    score = (1 + likes) * 0.5 ** (max(age, 0) / half_life)
+    return score if score >= floor else 0.0
+
+
+def _zipf_weights(n, s):
+    """Cumulative weights of ranks 1..n under a Zipf law with exponent ``s``."""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def _insert_ids(conn, table, rows):
+    """Insert ``rows`` and return their new ids, in order."""
+    stmt = db.insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    return conn.execute(stmt, rows).scalars().all()
+
+
+def _words(rng, low, high, length):
+    """``low`` to ``high`` random words, cut at a word to fit ``length`` characters."""
+    text = ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+    if len(text) > length:
+        text = text[:length + 1].rsplit(' ', 1)[0]
+    return text
+
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+    'incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud '
+    'exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure'
+).split()
+
+
+@click.command('seed')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--posts', default=10000, show_default=True)
+@click.option('--tags', default=100, show_default=True)
+@click.option('--likes-per-post', default=5.0, show_default=True, help='Mean likes per post, at most one per user.')
+@click.option('--tags-per-post', default=3, show_default=True, help='Most tags on one post.')
+@click.option('--zipf', default=1.1, show_default=True,
+              help='Skew of authors, tags and likes; 0 spreads them evenly.')
+@click.option('--days', default=365, show_default=True, help='Posts are spread over this many days.')
+@click.option('--until', type=click.DateTime(['%Y-%m-%d']), default=None,
+              help='Date of the newest post [default: today].')
+@click.option('--seed', 'seed_value', default=0, show_default=True, help='Random seed.')
+@click.option('--password', default='password', show_default=True, help='Password of every user.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per INSERT batch.')
+@with_appcontext
+def seed_command(users, posts, tags, likes_per_post, tags_per_post, zipf, days, until,
+                 seed_value, password, batch_size):
+    """Fill the database with synthetic users, posts, tags and likes.
+
+    Authors, tags and likes follow Zipf laws, so a few users write most
+    posts and a few posts get most likes. The same options give the
+    same data. Rows are added to what is already there.
+    """
+    rng = random.Random(seed_value)
+    # one hash for everybody, hashing per user would take longer than the rest
+    password_hash = generate_password_hash(password)
+    until = datetime.combine((until or datetime.now(timezone.utc)).date(), clock())
+    start = time.perf_counter()
+
+    with db.engine.connect() as conn:
+        first_user = conn.execute(db.select(db.func.coalesce(db.func.max(User.id), 0))).scalar() + 1
+        user_ids = []
+        for low in range(0, users, batch_size):
+            user_ids += _insert_ids(conn, User.__table__, [
+                {'username': f'user{first_user + i}', 'password': password_hash}
+                for i in range(low, min(users, low + batch_size))
+            ])
+        first_tag = conn.execute(db.select(db.func.coalesce(db.func.max(Tags.id), 0))).scalar() + 1
+        tag_ids = _insert_ids(conn, Tags.__table__, [
+            {'name': f'topic{first_tag + i}'} for i in range(tags)
+        ])
+        conn.commit()
+
+        author_weights = _zipf_weights(len(user_ids), zipf)
+        tag_weights = _zipf_weights(len(tag_ids), zipf) if tag_ids else None
+        # the popularity rank of each post sets its share of all likes
+        ranks = list(range(1, posts + 1))
+        rng.shuffle(ranks)
+        like_weights = _zipf_weights(posts, zipf)
+        like_scale = likes_per_post * posts / like_weights[-1] if posts else 0
+        span = timedelta(days=days).total_seconds()
+        half_life = current_app.config['TRENDING_HALF_LIFE'].total_seconds()
+        score_floor = current_app.config['TRENDING_SCORE_FLOOR']
+        # String(n) limits hold on Postgres, SQLite would store anything
+        title_length = Post.__table__.c.title.type.length
+        body_length = Post.__table__.c.body.type.length
+
+        counts = {'posts': 0, 'tags': 0, 'likes': 0}
+        tag_counts = Counter()
+        for low in range(0, posts, batch_size):
+            indexes = range(low, min(posts, low + batch_size))
+            rows = []
+            for i in indexes:
+                age = span * (posts - 1 - i) / posts
+                likes = min(len(user_ids), round(like_scale / ranks[i] ** zipf))
+                rows.append({
+                    'title': _words(rng, 2, 8, title_length).capitalize(),
+                    'body': _words(rng, 20, 200, body_length),
+                    'author_id': rng.choices(user_ids, cum_weights=author_weights)[0],
+                    'created': until - timedelta(seconds=age),
+                    'likes': likes,
+                    'score': _initial_score(likes, age, half_life, score_floor),
+                })
+            post_ids = _insert_ids(conn, Post.__table__, rows)
+
+            links = []
+            if tag_ids:
+                for post_id in post_ids:
+                    chosen = set(rng.choices(tag_ids, cum_weights=tag_weights,
+                                             k=rng.randint(0, tags_per_post)))
+                    links += [{'post_id': post_id, 'tag_id': tag_id} for tag_id in chosen]
+            if links:
+                conn.execute(db.insert(tags_post), links)
+                tag_counts.update(link['tag_id'] for link in links)
+            likes = [{'post_id': post_id, 'user_id': user_id}
+                     for post_id, row in zip(post_ids, rows)
+                     for user_id in rng.sample(user_ids, row['likes'])]
+            for chunk in _batches(likes, batch_size):
+                conn.execute(db.insert(LikedPosts), chunk)
+            conn.commit()
+
+            counts['posts'] += len(rows)
+            counts['tags'] += len(links)
+            counts['likes'] += len(likes)
+        adjust_tag_counts(tag_counts, bind=conn)
+        conn.commit()
+
+    bump_content_version()
+    db.session.commit()
+
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Seeded {len(user_ids)} users, {len(tag_ids)} tags, {counts['posts']} posts, "
+        f"{counts['tags']} tag links and {counts['likes']} likes in {elapsed:.1f}s."
+    )
+
+
+@click.command('recount-likes')
+@with_appcontext
+def recount_likes_command():
+    """Set every post's like counter from its liked_posts rows.
+
+    Repairs counters that lost buffered updates when a worker running
+    with LIKES_WRITE_BEHIND died before flushing.
+    """
+    likes = (
+        db.select(db.func.count())
+        .where(LikedPosts.post_id == Post.id)
+        .scalar_subquery()
+    )
+    changed = db.session.execute(
+        db.update(Post).where(Post.likes != likes).values(likes=likes)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if changed:
+        bump_content_version()
+    db.session.commit()
+    click.echo(f"Fixed the like count of {changed} posts.")
+
+
+@click.command('decay-scores')
+@with_appcontext
+def decay_scores_command():
+    """Decay trending scores by the time passed since the last run.
+
+    Scores halve every TRENDING_HALF_LIFE however often this runs, so
+    run it from cron as often as the ranking should move. Scores under
+    TRENDING_SCORE_FLOOR drop to 0 and later runs skip them.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    state = db.session.execute(db.select(ScoreDecay).with_for_update()).scalar()
+    if state is None:
+        db.session.add(ScoreDecay(id=1, decayed=now))
+        db.session.commit()
+        click.echo("Nothing to decay yet, scores decay from now on.")
+        return
+
+    elapsed = max((now - state.decayed).total_seconds(), 0)
+    factor = 0.5 ** (elapsed / current_app.config['TRENDING_HALF_LIFE'].total_seconds())
+    decayed = Post.score * factor
+    changed = db.session.execute(
+        db.update(Post)
+        .where(Post.score != 0)
+        .values(score=db.case((db.func.abs(decayed) < current_app.config['TRENDING_SCORE_FLOOR'], 0.0),
+                              else_=decayed))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    state.decayed = now
+    # the trending order changed, pages and their cursors are stale
+    bump_content_version()
+    db.session.commit()
+    click.echo(f"Decayed {changed} post scores by {factor:.4f}.")
+
+
+def init_app(app):
+    app.cli.add_command(import_posts_command)
+    app.cli.add_command(export_posts_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(recount_likes_command)
+    app.cli.add_command(decay_scores_command)
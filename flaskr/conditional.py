@@ -0,0 +1,94 @@
+import functools
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, request, session
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func
+
+from flaskr.database import db, insert_ignore
+from flaskr.models import ContentVersion
+
+CONTENT_VERSION_ID = 1
+
+
+def content_version():
+    """Return ``(version, updated)`` of the site's content, ``(0, None)`` before any write."""
+    row = db.session.execute(
+        db.select(ContentVersion.version, ContentVersion.updated)
+        .where(ContentVersion.id == CONTENT_VERSION_ID)
+    ).first()
+    return (row.version, row.updated) if row else (0, None)
+
+
+def bump_content_version(bind=None):
+    """Mark cached pages stale. Runs in the caller's transaction, or ``bind``'s."""
+    executor = bind or db.session
+    bumped = executor.execute(
+        db.update(ContentVersion)
+        .where(ContentVersion.id == CONTENT_VERSION_ID)
+        .values(version=ContentVersion.version + 1, updated=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not bumped:
+        executor.execute(
+            insert_ignore(ContentVersion, bind=bind)
+            .values(id=CONTENT_VERSION_ID, version=1, updated=func.now())
+        )
+
+
+def conditional(per_viewer=False):
+    """Answer revalidation requests with 304 before the view runs.
+
+    The ETag is derived from the content version, the full request path
+    and, for pages that differ per user, the JWT identity. Last-Modified
+    is only honoured for pages that look the same to every viewer, and
+    only sent once the second of the last write is over. Place
+    it below ``jwt_required`` so the identity is available.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped_view(**kwargs):
+            # a pending flash message has to be shown, never revalidate over it
+            if '_flashes' in session:
+                return view(**kwargs)
+
+            version, updated = content_version()
+            parts = [str(version), request.full_path]
+            likes = current_app.extensions.get('like_buffer')
+            if likes:
+                # unflushed like counts are part of the page too; the tag is
+                # per process, so leave it out once every delta is written
+                # and other workers can answer the revalidation
+                parts.append(likes.etag())
+            if per_viewer:
+                parts.append(str(get_jwt_identity()))
+            etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+            last_modified = updated.replace(tzinfo=timezone.utc) if updated else None
+            if last_modified and datetime.now(timezone.utc) < last_modified + timedelta(seconds=1):
+                # stored times have whole seconds, a write later in this second
+                # would carry the same date: don't validate by date until it ends
+                last_modified = None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (not per_viewer and last_modified is not None
+                                and request.if_modified_since is not None
+                                and request.if_modified_since >= last_modified)
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if per_viewer:
+                response.cache_control.private = True
+            return response
+        return wrapped_view
+    return decorator
@@ -1,7 +1,11 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv # type: ignore
+from flaskr.database import sqlite_read_only_uri
 
-load_dotenv()
+# flaskr/.env fills in whatever the environment leaves unset; it is
+# loaded by its path, find_dotenv() would walk the call stack for it
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
 class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -12,6 +16,41 @@ class Config:
     JWT_COOKIE_SECURE = False
     JWT_ACCESS_COOKIE_PATH = "/"
     JWT_COOKIE_CSRF_PROTECT = False
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    JWT_REFRESH_COOKIE_PATH = "/auth/refresh"
+    # re-sign the access token on a response once it has less than this left
+    JWT_ACCESS_REFRESH_THRESHOLD = timedelta(minutes=5)
+    FEED_PAGE_SIZE = 20
+    IDENTITY_CACHE_SIZE = 1024
+    IDENTITY_CACHE_TTL = 60
+    FRAGMENT_CACHE_SIZE = 2048
+    TAGS_TOP_POSTS = 5
+    # PRAGMA name -> value, run on every new SQLite connection. SQLite
+    # ignores foreign keys unless asked, deleting a post relies on them
+    # to remove its likes and tag links
+    SQLITE_PRAGMAS = {"foreign_keys": "ON"}
+    # read-only bind for the SELECTs of GET requests, None reads the primary
+    READ_REPLICA_URI = None
+    # seconds a client keeps reading the primary after one of its writes
+    READ_REPLICA_STICKY = 5
+    # Server-Timing header and slow request log, off unless INSTRUMENTATION=1
+    INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION") == "1"
+    SLOW_REQUEST_MS = 500
+    # slowest statements listed with a slow request
+    SLOW_REQUEST_QUERIES = 5
+    METRICS_ENABLED = True
+    # shared by all workers of a server; unset, /metrics covers one process
+    METRICS_DIR = os.getenv("METRICS_DIR")
+    METRICS_FLUSH_INTERVAL = 1.0
+    # merge post.likes updates in memory and write them in batches
+    LIKES_WRITE_BEHIND = False
+    LIKES_FLUSH_INTERVAL = 1.0
+    LIKES_FLUSH_SIZE = 1000
+    # post scores halve over this period, see `flask decay-scores`
+    TRENDING_HALF_LIFE = timedelta(hours=24)
+    # decayed scores below this drop to 0 and are left alone afterwards
+    TRENDING_SCORE_FLOOR = 0.01
 
 class DevelopmentConfig(Config):
     DEVELOPMENT = True
@@ -27,8 +66,34 @@ class StagingConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.getenv("STAGING_DATABASE_URL")
 
+class ProductionConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.getenv("PRODUCTION_DATABASE_URL")
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.getenv("DATABASE_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", 10)),
+        "pool_timeout": 10,
+        # seconds pysqlite waits on a locked database before raising
+        "connect_args": {"timeout": 5},
+    }
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        # readers no longer block the writer and vice versa
+        "journal_mode": "WAL",
+        # safe with WAL, only the last commits may roll back on power loss
+        "synchronous": "NORMAL",
+        # negative values are KiB: 64 MB page cache per connection
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    }
+    # a real replica when given, else a read-only connection to the same file
+    READ_REPLICA_URI = (os.getenv("PRODUCTION_REPLICA_URL")
+                        or sqlite_read_only_uri(SQLALCHEMY_DATABASE_URI))
+
 config = {
     "development": DevelopmentConfig,
     "testing": TestingConfig,
-    "staging": StagingConfig
+    "staging": StagingConfig,
+    "production": ProductionConfig,
 }
@@ -1,18 +1,164 @@
+import click
+from flask import current_app, g, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase
-from flask_migrate import Migrate # type: ignore
 from flask_jwt_extended import JWTManager
 
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
-migrate = Migrate()
+REPLICA_BIND = 'replica'
+# set after a write so the next reads of that client see it on the primary
+PRIMARY_COOKIE = 'db_primary'
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# PRAGMAs that change the database file rather than the connection, only
+# the primary runs them
+FILE_PRAGMAS = frozenset({'journal_mode'})
+
+
+class RoutingSession(Session):
+    """Session that sends the SELECTs of safe requests to the read replica.
+
+    Everything else goes to the primary: writes, flushes, statements
+    outside a request, and every statement of a session that already
+    wrote, so a request always reads its own writes. Without a replica
+    bind it behaves like the stock session.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        if self._flushing or (clause is not None and not clause.is_select):
+            self.info['primary'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        return (
+            clause is not None
+            and clause.is_select
+            and not self._flushing
+            and not self.info.get('primary')
+            and REPLICA_BIND in self._db.engines
+            and has_request_context()
+            and request.method in SAFE_METHODS
+            and not g.get('use_primary')
+            and PRIMARY_COOKIE not in request.cookies
+        )
+
+
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
+class LazyMigrate:
+    """Stand-in for Flask-Migrate's ``app.extensions['migrate']``.
+
+    The first attribute lookup sets up the real extension, so
+    ``flask_migrate.upgrade()`` and the rest work as usual.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __getattr__(self, name):
+        if self.app.extensions.get('migrate') is self:
+            from flask_migrate import Migrate # type: ignore
+            Migrate(self.app, db)
+        return getattr(self.app.extensions['migrate'], name)
+
+
+class MigrateCommands(click.Group):
+    """``flask db``, loads Flask-Migrate's command group when it runs."""
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate.cli import db as migrate_commands # type: ignore
+        return migrate_commands.make_context(info_name, args, parent=parent, **extra)
+
+    def invoke(self, ctx):
+        return ctx.command.invoke(ctx)
+
+
+def use_primary():
+    """Read from the primary for the rest of this request."""
+    g.use_primary = True
+
+
+def sqlite_read_only_uri(uri):
+    """``mode=ro`` URI for the same SQLite file, or None if ``uri`` isn't one."""
+    if not uri:
+        return None
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return f"sqlite:///file:{url.database}?mode=ro&uri=true"
+
+
 def init_app(app):
+    replica = app.config.get('READ_REPLICA_URI')
+    if replica:
+        app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), REPLICA_BIND: replica}
+        app.after_request(stick_to_primary)
     db.init_app(app)
+    # the replica serves the default bind's tables and has no models of its
+    # own; without its empty metadata create_all() never touches it
+    db.metadatas.pop(REPLICA_BIND, None)
     jwt.init_app(app)
-    migrate.init_app(app, db)
-    
\ No newline at end of file
+    # Flask-Migrate imports all of alembic, which only migrations need
+    app.extensions['migrate'] = LazyMigrate(app)
+    app.cli.add_command(MigrateCommands('db', help='Perform database migrations.'))
+
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if pragmas:
+        with app.app_context():
+            for bind, engine in db.engines.items():
+                if engine.dialect.name != 'sqlite':
+                    continue
+                if bind == REPLICA_BIND:
+                    # a mode=ro connection can't change the file
+                    engine_pragmas = {name: value for name, value in pragmas.items()
+                                      if name not in FILE_PRAGMAS}
+                else:
+                    engine_pragmas = pragmas
+                event.listen(engine, 'connect', sqlite_pragma_hook(engine_pragmas))
+            replica_engine = db.engines.get(REPLICA_BIND)
+            if (replica_engine is not None and replica_engine.dialect.name == 'sqlite'
+                    and db.engine.dialect.name == 'sqlite' and FILE_PRAGMAS & pragmas.keys()):
+                # switch the file to WAL through the primary before the replica
+                # reads it, the pooled connection keeps the -shm file around
+                with db.engine.connect():
+                    pass
+
+
+def stick_to_primary(response):
+    """After a write, keep the client on the primary until the replica caught up."""
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        max_age = current_app.config['READ_REPLICA_STICKY']
+        response.set_cookie(PRIMARY_COOKIE, '1', max_age=max_age, httponly=True)
+    return response
+
+
+def sqlite_pragma_hook(pragmas):
+    """Engine ``connect`` listener that runs ``PRAGMA name = value`` for each pragma."""
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+    return set_pragmas
+
+
+def insert_ignore(table, bind=None):
+    """INSERT that silently skips rows clashing with a unique key.
+
+    Emitted as ON CONFLICT DO NOTHING so concurrent writers never fail on
+    the primary key, the row count tells whether the row was new. Pass
+    ``bind`` when the statement runs outside the session.
+    """
+    if (bind or db.session.get_bind()).dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
@@ -0,0 +1,128 @@
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, current_app, g, has_app_context, request, template_rendered
+from flask_jwt_extended.config import config as jwt_config
+from sqlalchemy import event
+
+from flaskr.database import db, jwt
+
+# Server-Timing metric name -> description
+METRICS = {
+    'db': 'SQL',
+    'tpl': 'Templates',
+    'jwt': 'JWT decode and lookup',
+    'total': 'Handler',
+}
+
+
+def _timings():
+    """This request's timings, or None when it isn't instrumented."""
+    if has_app_context():
+        return g.get('timings')
+    return None
+
+
+def record(name, seconds):
+    timings = _timings()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to metric ``name`` of this request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def init_app(app):
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    app.before_request(start_timing)
+    # after_request hooks run in reverse, so this one sees every other hook
+    app.after_request(server_timing)
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', query_started)
+            event.listen(engine, 'after_cursor_execute', query_finished)
+
+
+def start_timing():
+    g.timings = {}
+    g.queries = []
+    g.request_started = time.perf_counter()
+
+
+def query_started(conn, cursor, statement, parameters, context, executemany):
+    if _timings() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if _timings() is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    record('db', elapsed)
+    g.queries.append((elapsed, statement))
+
+
+def template_started(sender, template, context, **extra):
+    g.setdefault('templates_started', []).append(time.perf_counter())
+
+
+def template_finished(sender, template, context, **extra):
+    started = g.get('templates_started')
+    if started:
+        record('tpl', time.perf_counter() - started.pop())
+
+
+# The JWT extension has no hooks around decoding itself: the key loader runs
+# right before it and the verification loader right after.
+@jwt.decode_key_loader
+def jwt_decode_started(jwt_header, jwt_data):
+    if _timings() is not None:
+        g.jwt_decode_started = time.perf_counter()
+    return jwt_config.decode_key
+
+
+@jwt.token_verification_loader
+def jwt_decode_finished(jwt_header, jwt_data):
+    started = g.pop('jwt_decode_started', None) if has_app_context() else None
+    if started is not None:
+        record('jwt', time.perf_counter() - started)
+    return True
+
+
+def server_timing(response):
+    """Send this request's timings as Server-Timing and log it when slow."""
+    timings = g.get('timings')
+    if timings is None:
+        return response
+    timings['total'] = time.perf_counter() - g.request_started
+    entries = []
+    for name, description in METRICS.items():
+        if name not in timings:
+            continue
+        if name == 'db':
+            description = f"{len(g.queries)} queries"
+        entries.append(f'{name};desc="{description}";dur={timings[name] * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+
+    total_ms = timings['total'] * 1000
+    if total_ms >= current_app.config['SLOW_REQUEST_MS']:
+        top = sorted(g.queries, key=lambda query: query[0], reverse=True)
+        top = top[:current_app.config['SLOW_REQUEST_QUERIES']]
+        current_app.logger.warning(
+            'Slow request %s %s: %.1f ms, %d queries in %.1f ms%s',
+            request.method, request.full_path.rstrip('?'), total_ms,
+            len(g.queries), timings.get('db', 0.0) * 1000,
+            ''.join(f'\n  {elapsed * 1000:.1f} ms  {statement}' for elapsed, statement in top),
+        )
+    return response
@@ -0,0 +1,231 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import Blueprint, current_app, g, request
+
+from flaskr.cache import TTLCache
+from flaskr.database import db
+
+bp = Blueprint('metrics', __name__)
+
+# upper bounds in seconds, +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Registry:
+    """Request counters and latency histograms of one worker process.
+
+    Recording only touches dicts under a lock. With a ``directory``, a
+    snapshot of the process is written there at most every
+    ``flush_interval`` seconds as ``<pid>.json``; the worker answering a
+    scrape adds up its own live numbers and every other worker's file.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.requests = Counter()
+        # endpoint -> per bucket counts (last one is +Inf), then the sum
+        self.latency = {}
+        # pool and cache numbers as of the last flush
+        self.gauges = {}
+        self._flushed = 0.0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def observe(self, endpoint, method, status, seconds):
+        with self._lock:
+            self.requests[endpoint, method, status] += 1
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'requests': [[*key, count] for key, count in self.requests.items()],
+                'latency': {endpoint: list(values) for endpoint, values in self.latency.items()},
+                'gauges': self.gauges,
+            }
+
+    def maybe_flush(self, gauges):
+        now = time.monotonic()
+        if self.directory and now - self._flushed >= self.flush_interval:
+            self._flushed = now
+            self.flush(gauges)
+
+    def flush(self, gauges=None):
+        if gauges is not None:
+            self.gauges = gauges
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self, gauges):
+        """This process's live snapshot followed by the other workers' files."""
+        self.gauges = gauges
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+        own = f'{os.getpid()}.json'
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # a worker replaced its file mid-read; it'll be there next scrape
+                continue
+        return snapshots
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def process_gauges():
+    """Pool and cache numbers of this process, for the snapshot."""
+    pools = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        if hasattr(pool, 'checkedout'):
+            pools[key or 'default'] = [pool.checkedout(), pool.size()]
+    caches = {
+        name: [cache.hits, cache.misses]
+        for name, cache in current_app.extensions.items()
+        if isinstance(cache, TTLCache)
+    }
+    return {'pools': pools, 'caches': caches}
+
+
+@bp.record_once
+def init_registry(state):
+    state.app.extensions['metrics'] = Registry(
+        directory=state.app.config['METRICS_DIR'],
+        flush_interval=state.app.config['METRICS_FLUSH_INTERVAL'],
+    )
+
+
+@bp.before_app_request
+def start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+
+@bp.after_app_request
+def observe_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    registry = current_app.extensions['metrics']
+    registry.observe(request.endpoint or 'unmatched', request.method,
+                     response.status_code, time.perf_counter() - started)
+    if registry.directory:
+        registry.maybe_flush(process_gauges())
+    return response
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render(snapshots):
+    """Prometheus text exposition of the summed snapshots."""
+    requests = Counter()
+    latency = {}
+    caches = {}
+    for snapshot in snapshots:
+        for endpoint, method, status, count in snapshot['requests']:
+            requests[endpoint, method, status] += count
+        for endpoint, values in snapshot['latency'].items():
+            total = latency.setdefault(endpoint, [0] * len(values))
+            latency[endpoint] = [a + b for a, b in zip(total, values)]
+        for name, (hits, misses) in snapshot['gauges'].get('caches', {}).items():
+            total = caches.setdefault(name, [0, 0])
+            total[0] += hits
+            total[1] += misses
+
+    lines = [
+        '# HELP flaskr_requests_total Requests handled, by endpoint, method and status.',
+        '# TYPE flaskr_requests_total counter',
+    ]
+    for (endpoint, method, status), count in sorted(requests.items()):
+        lines.append(f'flaskr_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP flaskr_request_duration_seconds Request latency by endpoint.',
+        '# TYPE flaskr_request_duration_seconds histogram',
+    ]
+    for endpoint, values in sorted(latency.items()):
+        *buckets, seconds = values
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), buckets):
+            cumulative += count
+            lines.append(f'flaskr_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+        lines.append(f'flaskr_request_duration_seconds_sum{_labels(endpoint=endpoint)} {seconds}')
+        lines.append(f'flaskr_request_duration_seconds_count{_labels(endpoint=endpoint)} {cumulative}')
+
+    # pools belong to a process, so dead workers' last numbers are dropped
+    lines += [
+        '# HELP flaskr_db_pool_checked_out Connections checked out of the pool.',
+        '# TYPE flaskr_db_pool_checked_out gauge',
+    ]
+    sizes = []
+    for snapshot in snapshots:
+        if not _alive(snapshot['pid']):
+            continue
+        for bind, (checked_out, size) in sorted(snapshot['gauges'].get('pools', {}).items()):
+            labels = _labels(bind=bind, pid=snapshot['pid'])
+            lines.append(f'flaskr_db_pool_checked_out{labels} {checked_out}')
+            sizes.append(f'flaskr_db_pool_size{labels} {size}')
+    lines += [
+        '# HELP flaskr_db_pool_size Configured pool size.',
+        '# TYPE flaskr_db_pool_size gauge',
+        *sizes,
+    ]
+
+    lines += [
+        '# HELP flaskr_cache_requests_total Cache lookups, by cache and result.',
+        '# TYPE flaskr_cache_requests_total counter',
+    ]
+    ratios = []
+    for name, (hits, misses) in sorted(caches.items()):
+        lines.append(f'flaskr_cache_requests_total{_labels(cache=name, result="hit")} {hits}')
+        lines.append(f'flaskr_cache_requests_total{_labels(cache=name, result="miss")} {misses}')
+        if hits + misses:
+            ratios.append(f'flaskr_cache_hit_ratio{_labels(cache=name)} {hits / (hits + misses):.4f}')
+    lines += [
+        '# HELP flaskr_cache_hit_ratio Share of cache lookups that hit.',
+        '# TYPE flaskr_cache_hit_ratio gauge',
+        *ratios,
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+@bp.route('/metrics')
+def metrics():
+    registry = current_app.extensions['metrics']
+    body = render(registry.collect(process_gauges()))
+    return current_app.response_class(body, mimetype=None, content_type=CONTENT_TYPE)
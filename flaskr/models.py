@@ -1,9 +1,17 @@
-from sqlalchemy import ForeignKey, String, DateTime, Integer, Table, Column, func
+from sqlalchemy import ForeignKey, String, DateTime, Float, Integer, Table, Column, Index, func
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from flaskr.database import db
 from typing import List
 from flaskr.database import Base
 
+# SQLite fills `created` with CURRENT_TIMESTAMP, which has no fractional
+# part. Binding datetimes in the same format keeps string comparisons in
+# keyset cursors consistent with the stored values.
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
 
 class User(db.Model):
     __tablename__ = "user"
@@ -19,18 +27,32 @@ class User(db.Model):
 
 class Post(db.Model):
     __tablename__ = "post"
+    __table_args__ = (
+        Index("ix_post_created_id", "created", "id"),
+        Index("ix_post_score_id", "score", "id"),
+        # ids of deleted posts are never handed out again, other workers may
+        # still cache them (fragments, pending likes)
+        {"sqlite_autoincrement": True},
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    created: Mapped[DateTime] = mapped_column(DateTime, nullable=False, default=func.now())
+    created: Mapped[DateTime] = mapped_column(Timestamp, nullable=False, default=func.now())
     title: Mapped[str] = mapped_column(String(100), nullable=False)
     body: Mapped[str] = mapped_column(String(300), nullable=False)
     likes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # bumped whenever the rendered post changes, keys the fragment cache
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1", nullable=False)
+    # trending rank: +1 per like, halved every TRENDING_HALF_LIFE by `flask decay-scores`
+    score: Mapped[float] = mapped_column(Float, default=1.0, server_default="1", nullable=False)
 
     author_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
     author: Mapped["User"] = relationship(back_populates="posts")
 
-    liked_posts: Mapped[List["LikedPosts"]] = relationship(back_populates="post",cascade="all, delete-orphan")
+    # ON DELETE CASCADE removes the likes and tag links of a deleted post,
+    # passive_deletes keeps the ORM from loading them to delete row by row
+    liked_posts: Mapped[List["LikedPosts"]] = relationship(back_populates="post",cascade="all, delete-orphan",
+                                                           passive_deletes=True)
 
-    tags: Mapped[List["Tags"]] = relationship(secondary= "tags_post", back_populates="post")
+    tags: Mapped[List["Tags"]] = relationship(secondary= "tags_post", back_populates="post", passive_deletes=True)
 
     def __repr__(self) -> str:
         return f"<Post(id={self.id!r}, author_id={self.author_id!r}, title={self.title!r}, body={self.body[:50]}...)>"
@@ -38,8 +60,12 @@ class Post(db.Model):
 
 class LikedPosts(db.Model):
     __tablename__ = "liked_posts"
+    __table_args__ = (
+        # the primary key serves user -> posts, this one post -> users
+        Index("ix_liked_posts_post_id_user_id", "post_id", "user_id"),
+    )
     user_id: Mapped[int] = mapped_column(ForeignKey('user.id'), primary_key=True, nullable=False)
-    post_id: Mapped[int] = mapped_column(ForeignKey('post.id'), primary_key=True, nullable=False)
+    post_id: Mapped[int] = mapped_column(ForeignKey('post.id', ondelete="CASCADE"), primary_key=True, nullable=False)
 
     user : Mapped["User"] = relationship(back_populates="liked_posts")
     post : Mapped["Post"] = relationship(back_populates="liked_posts")
@@ -51,6 +77,8 @@ class Tags(db.Model):
     __tablename__ = "tags"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(30), unique=True, nullable=False)
+    # maintained by the write paths through queries.adjust_tag_counts
+    post_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     post: Mapped[List["Post"]] = relationship(secondary= "tags_post", back_populates="tags")
 
@@ -60,7 +88,29 @@ class Tags(db.Model):
 tags_post = Table(
     "tags_post",
     Base.metadata,
-    Column("post_id", ForeignKey("post.id")),
-    Column("tag_id", ForeignKey("tags.id")),
+    Column("post_id", ForeignKey("post.id", ondelete="CASCADE"), primary_key=True),
+    Column("tag_id", ForeignKey("tags.id"), primary_key=True),
+    # the primary key serves post -> tags, this one tag -> posts
+    Index("ix_tags_post_tag_id_post_id", "tag_id", "post_id"),
 )
- 
\ No newline at end of file
+ 
+
+class ContentVersion(db.Model):
+    """Single row counter bumped by every write that changes a public page."""
+    __tablename__ = "content_version"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated: Mapped[DateTime] = mapped_column(Timestamp, nullable=False, default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<ContentVersion(version={self.version!r}, updated={self.updated!r})>"
+
+
+class ScoreDecay(db.Model):
+    """Single row holding when post scores were last decayed."""
+    __tablename__ = "score_decay"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    decayed: Mapped[DateTime] = mapped_column(Timestamp, nullable=False, default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<ScoreDecay(decayed={self.decayed!r})>"
@@ -0,0 +1,112 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Optional
+
+from sqlalchemy import DateTime, Float, Integer, literal, tuple_
+
+
+@dataclass
+class Page:
+    items: List[Any] = field(default_factory=list)
+    older: Optional[str] = None
+    newer: Optional[str] = None
+
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_value(key, value):
+    # JSON hands back any type; only the one the key's column holds may
+    # reach the query, anything else would fail in the driver
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if isinstance(key.type, DateTime):
+        if not isinstance(value, str):
+            raise TypeError(value)
+        return datetime.fromisoformat(value)
+    if isinstance(key.type, Integer):
+        if not isinstance(value, int):
+            raise TypeError(value)
+    elif isinstance(key.type, Float):
+        if not isinstance(value, (int, float)):
+            raise TypeError(value)
+    return value
+
+
+def decode_cursor(cursor, keys):
+    """Turn a cursor string back into values for ``keys``.
+
+    Returns None when the cursor is malformed, or holds a value of the
+    wrong type for its key, so callers can fall back to the first page
+    instead of erroring.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != len(keys):
+            return None
+        return tuple(_decode_value(key, value) for key, value in zip(keys, payload))
+    except (ValueError, TypeError):
+        return None
+
+
+def _bound(keys, values):
+    # bind each value with its column's type, a bare tuple_ would fall
+    # back to the generic type and skip dialect specific formatting
+    return tuple_(*[literal(value, key.type) for key, value in zip(keys, values)])
+
+
+def _key_values(item, names):
+    return tuple(getattr(item, name) for name in names)
+
+
+def paginate(session, stmt, keys, per_page, older=None, newer=None, scalars=True,
+             key_names=None):
+    """Keyset pagination over ``keys`` in descending order.
+
+    ``older`` continues past the last row of a page, ``newer`` walks back
+    towards the first one. Both turn into a row-value comparison on the
+    ordering columns, so with a matching index every page costs the same
+    no matter how deep it is. Cursor values are read from each item's
+    attributes named after the keys, or ``key_names`` when given.
+    """
+    key_names = key_names or [key.key for key in keys]
+    after = decode_cursor(older, keys)
+    before = None if after else decode_cursor(newer, keys)
+
+    if after:
+        stmt = stmt.where(tuple_(*keys) < _bound(keys, after))
+    elif before:
+        stmt = stmt.where(tuple_(*keys) > _bound(keys, before))
+
+    if before:
+        stmt = stmt.order_by(*[key.asc() for key in keys])
+    else:
+        stmt = stmt.order_by(*[key.desc() for key in keys])
+    stmt = stmt.limit(per_page + 1)
+
+    result = session.execute(stmt)
+    rows = result.scalars().all() if scalars else result.all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+
+    page = Page(items=rows)
+    if rows:
+        if before:
+            has_older, has_newer = True, has_more
+        else:
+            has_older, has_newer = has_more, after is not None
+        if has_older:
+            page.older = encode_cursor(_key_values(rows[-1], key_names))
+        if has_newer:
+            page.newer = encode_cursor(_key_values(rows[0], key_names))
+    return page
@@ -0,0 +1,142 @@
+from sqlalchemy import Text, bindparam, case, cast, func
+from sqlalchemy.orm import joinedload, selectinload
+
+from flaskr.database import db
+from flaskr.models import LikedPosts, Post, Tags, tags_post
+
+# joins aggregated values; a control character can't clash with tag names
+LIST_SEPARATOR = '\x1f'
+
+# Loader options for the views. Each template walks these relationships
+# once per row, so they are loaded up front instead of lazily per post.
+
+# blog/index.html: author name and tag list of every post on the page
+feed_options = (
+    joinedload(Post.author),
+    selectinload(Post.tags),
+)
+
+# blog/update.html and the write views: the post's author and current tags
+post_options = (
+    joinedload(Post.author),
+    selectinload(Post.tags),
+)
+
+
+def liked_post_ids(user_id, post_ids):
+    """Return which of ``post_ids`` the user has liked.
+
+    Only the posts being rendered are looked up, so the result is bounded
+    by the page size rather than by how many posts the user ever liked.
+    """
+    if not post_ids:
+        return set()
+    stmt = db.select(LikedPosts.post_id).where(
+        LikedPosts.user_id == user_id, LikedPosts.post_id.in_(post_ids)
+    )
+    return set(db.session.execute(stmt).scalars())
+
+
+def aggregate_list(column):
+    """SQL aggregate joining ``column`` values into one separated string."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.string_agg(cast(column, Text), LIST_SEPARATOR)
+    return func.group_concat(column, LIST_SEPARATOR)
+
+
+def split_list(value, convert=str):
+    return [convert(item) for item in value.split(LIST_SEPARATOR)] if value else []
+
+
+def _group_by_post(stmt):
+    """``{post_id: [value, ...]}`` from rows of ``(post_id, value)``."""
+    grouped = {}
+    for post_id, value in db.session.execute(stmt):
+        grouped.setdefault(post_id, []).append(value)
+    return grouped
+
+
+def iter_post_records(batch_size=1000):
+    """Yield every post as a dict in the import-posts format, by id.
+
+    Posts are fetched ``batch_size`` at a time (a server-side cursor where
+    the driver has one). The tag names and likers of each batch are then
+    looked up with ``post_id IN (...)`` through the post side indexes of
+    tags_post and liked_posts. Memory depends on the size of one batch,
+    not on the total number of posts.
+    """
+    stmt = (
+        db.select(Post.id, Post.title, Post.body, Post.author_id, Post.created, Post.likes)
+        .order_by(Post.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for rows in db.session.execute(stmt).partitions():
+        post_ids = [row.id for row in rows]
+        tags = _group_by_post(
+            db.select(tags_post.c.post_id, Tags.name)
+            .join(Tags, Tags.id == tags_post.c.tag_id)
+            .where(tags_post.c.post_id.in_(post_ids))
+            .order_by(tags_post.c.post_id, Tags.name)
+        )
+        liked_by = _group_by_post(
+            db.select(LikedPosts.post_id, LikedPosts.user_id)
+            .where(LikedPosts.post_id.in_(post_ids))
+            .order_by(LikedPosts.post_id, LikedPosts.user_id)
+        )
+        for row in rows:
+            yield {
+                'id': row.id,
+                'title': row.title,
+                'body': row.body,
+                'author_id': row.author_id,
+                'created': row.created.isoformat(),
+                'likes': row.likes,
+                'tags': tags.get(row.id, []),
+                'liked_by': liked_by.get(row.id, []),
+            }
+
+
+def adjust_tag_counts(changes, bind=None):
+    """Apply ``{tag_id: delta}`` to Tags.post_count in the current transaction."""
+    params = [{'tag_id': tag_id, 'delta': delta} for tag_id, delta in changes.items() if delta]
+    if not params:
+        return
+    table = Tags.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam('tag_id'))
+        .values(post_count=table.c.post_count + bindparam('delta'))
+    )
+    (bind or db.session).execute(stmt, params)
+
+
+def shifted_score(score, delta):
+    """``score + delta`` kept at or above 0.
+
+    Scores decay, so taking back a like can subtract more than is left.
+    """
+    return case((score + delta < 0, 0.0), else_=score + delta)
+
+
+def top_posts_by_tag(limit, order='recent'):
+    """The ``limit`` newest (or most liked) posts of every tag, keyed by tag id.
+
+    One windowed query ranks the posts within each tag, so the page
+    doesn't load every tag's full post collection.
+    """
+    ordering = [Post.created.desc(), Post.id.desc()]
+    if order == 'liked':
+        ordering.insert(0, Post.likes.desc())
+    ranked = (
+        db.select(
+            tags_post.c.tag_id, Post.id, Post.title, Post.likes, Post.created,
+            func.row_number().over(partition_by=tags_post.c.tag_id, order_by=ordering).label('rank'),
+        )
+        .join(Post, Post.id == tags_post.c.post_id)
+        .subquery()
+    )
+    stmt = db.select(ranked).where(ranked.c.rank <= limit).order_by(ranked.c.tag_id, ranked.c.rank)
+    posts = {}
+    for row in db.session.execute(stmt):
+        posts.setdefault(row.tag_id, []).append(row)
+    return posts
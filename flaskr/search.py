@@ -0,0 +1,72 @@
+import re
+
+from sqlalchemy import DDL, column, event, func, literal_column, table
+from sqlalchemy.orm import joinedload
+
+from flaskr.database import db
+from flaskr.models import Post
+
+# External content FTS5 index over post.title and post.body, kept in sync
+# by triggers. The same statements live in migration 2eaabe9fb7e6; here
+# they are attached to the post table so db.create_all() builds them too.
+FTS_DDL = (
+    """CREATE VIRTUAL TABLE post_fts USING fts5(
+        title, body, content='post', content_rowid='id'
+    )""",
+    """CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+)
+
+for statement in FTS_DDL:
+    event.listen(Post.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+post_fts = table('post_fts', column('rowid'))
+
+# bm25 column weights: a hit in the title counts more than one in the body
+TITLE_WEIGHT = 5.0
+BODY_WEIGHT = 1.0
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query that matches all of its words.
+
+    Every word is quoted, so user input can never be parsed as FTS5
+    syntax (column filters, NEAR, unbalanced quotes...).
+    """
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def search_available():
+    return db.session.get_bind().dialect.name == 'sqlite'
+
+
+def search_posts(text, page=1, per_page=20):
+    """Posts matching ``text`` best first, as ``(posts, has_more)``.
+
+    Ranking has to score every match anyway, so pages are plain
+    LIMIT/OFFSET over the ranked matches.
+    """
+    query = fts_query(text)
+    if not query:
+        return [], False
+    rank = func.bm25(literal_column('post_fts'), TITLE_WEIGHT, BODY_WEIGHT)
+    stmt = (
+        db.select(Post)
+        .options(joinedload(Post.author))
+        .join(post_fts, post_fts.c.rowid == Post.id)
+        .where(literal_column('post_fts').op('MATCH')(query))
+        .order_by(rank, Post.id.desc())
+        .limit(per_page + 1)
+        .offset((page - 1) * per_page)
+    )
+    posts = db.session.execute(stmt).scalars().all()
+    return posts[:per_page], len(posts) > per_page
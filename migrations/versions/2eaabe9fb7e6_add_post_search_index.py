@@ -0,0 +1,53 @@
+"""add post search index
+
+Revision ID: 2eaabe9fb7e6
+Revises: 50eb4a085df4
+Create Date: 2026-10-18 11:36:09.742518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2eaabe9fb7e6'
+down_revision = '50eb4a085df4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is SQLite only, other databases go without search
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("""
+        CREATE VIRTUAL TABLE post_fts USING fts5(
+            title, body, content='post', content_rowid='id'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN
+            INSERT INTO post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN
+            INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN
+            INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+            INSERT INTO post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+        END
+    """)
+    op.execute("INSERT INTO post_fts(post_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER post_fts_update")
+    op.execute("DROP TRIGGER post_fts_delete")
+    op.execute("DROP TRIGGER post_fts_insert")
+    op.execute("DROP TABLE post_fts")
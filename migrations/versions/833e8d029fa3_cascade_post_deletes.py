@@ -0,0 +1,44 @@
+"""cascade post deletes
+
+Revision ID: 833e8d029fa3
+Revises: 22079a00e4a7
+Create Date: 2026-10-18 17:25:05.120250
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '833e8d029fa3'
+down_revision = '22079a00e4a7'
+branch_labels = None
+depends_on = None
+
+# SQLite's foreign keys are unnamed, name the reflected ones to drop them
+naming_convention = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+
+def upgrade():
+    # rows left behind by deletes while foreign keys weren't enforced
+    op.execute("DELETE FROM liked_posts WHERE post_id NOT IN (SELECT id FROM post)")
+    op.execute("DELETE FROM tags_post WHERE post_id NOT IN (SELECT id FROM post)")
+    with op.batch_alter_table('liked_posts', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_liked_posts_post_id_post', type_='foreignkey')
+        batch_op.create_foreign_key('fk_liked_posts_post_id_post', 'post', ['post_id'], ['id'], ondelete='CASCADE')
+
+    with op.batch_alter_table('tags_post', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_tags_post_post_id_post', type_='foreignkey')
+        batch_op.create_foreign_key('fk_tags_post_post_id_post', 'post', ['post_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('tags_post', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_tags_post_post_id_post', type_='foreignkey')
+        batch_op.create_foreign_key('fk_tags_post_post_id_post', 'post', ['post_id'], ['id'])
+
+    with op.batch_alter_table('liked_posts', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_liked_posts_post_id_post', type_='foreignkey')
+        batch_op.create_foreign_key('fk_liked_posts_post_id_post', 'post', ['post_id'], ['id'])
@@ -0,0 +1,58 @@
+"""never reuse post ids
+
+Revision ID: b1bd6b61f4cd
+Revises: 833e8d029fa3
+Create Date: 2026-10-18 18:02:11.514206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1bd6b61f4cd'
+down_revision = '833e8d029fa3'
+branch_labels = None
+depends_on = None
+
+# copying post drops its triggers, these are the ones of 2eaabe9fb7e6
+SEARCH_TRIGGERS = (
+    """
+        CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN
+            INSERT INTO post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+        END
+    """,
+    """
+        CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN
+            INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        END
+    """,
+    """
+        CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN
+            INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+            INSERT INTO post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+        END
+    """,
+)
+
+
+def _recreate_post(autoincrement):
+    with op.batch_alter_table('post', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    for statement in SEARCH_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade():
+    # only SQLite hands out the id of a deleted last row again; AUTOINCREMENT
+    # is a table option there, so post is copied into a new table
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _recreate_post(True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _recreate_post(False)
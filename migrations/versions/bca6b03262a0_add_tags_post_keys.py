@@ -0,0 +1,49 @@
+"""add tags_post keys
+
+Revision ID: bca6b03262a0
+Revises: 2eaabe9fb7e6
+Create Date: 2026-10-18 12:20:51.006337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bca6b03262a0'
+down_revision = '2eaabe9fb7e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the table never had a key, drop empty and duplicate rows first
+    op.execute("DELETE FROM tags_post WHERE post_id IS NULL OR tag_id IS NULL")
+    op.execute("""
+        DELETE FROM tags_post WHERE EXISTS (
+            SELECT 1 FROM tags_post AS other
+            WHERE other.post_id = tags_post.post_id
+              AND other.tag_id = tags_post.tag_id
+              AND other.rowid < tags_post.rowid
+        )
+    """ if op.get_bind().dialect.name == 'sqlite' else """
+        DELETE FROM tags_post WHERE EXISTS (
+            SELECT 1 FROM tags_post AS other
+            WHERE other.post_id = tags_post.post_id
+              AND other.tag_id = tags_post.tag_id
+              AND other.ctid < tags_post.ctid
+        )
+    """)
+    with op.batch_alter_table('tags_post', schema=None) as batch_op:
+        batch_op.alter_column('post_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('tag_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key('pk_tags_post', ['post_id', 'tag_id'])
+        batch_op.create_index('ix_tags_post_tag_id_post_id', ['tag_id', 'post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tags_post', schema=None) as batch_op:
+        batch_op.drop_index('ix_tags_post_tag_id_post_id')
+        batch_op.drop_constraint('pk_tags_post', type_='primary')
+        batch_op.alter_column('tag_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('post_id', existing_type=sa.Integer(), nullable=True)
@@ -1,5 +1,8 @@
 import os
+from contextlib import contextmanager
+
 import pytest
+from sqlalchemy import event
 from flaskr import create_app
 from flaskr.database import db
 
@@ -31,6 +34,37 @@ def client(app):
 def runner(app):
     return app.test_cli_runner()
 
+
+@pytest.fixture
+def query_budget(app):
+    """Fail the test when the wrapped block runs more than ``budget`` SQL statements.
+
+        with query_budget(3):
+            client.get('/')
+    """
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def budget(limit):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        if len(statements) > limit:
+            pytest.fail(
+                f'{len(statements)} queries over a budget of {limit}:\n'
+                + '\n'.join(statements)
+            )
+
+    return budget
+
 class AuthActions(object):
     def __init__(self, client):
         self._client = client
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from flaskr.database import db
+from flaskr.models import Post, Tags
+
+
+def _add_posts(app, count):
+    with app.app_context():
+        tag = Tags(name='news')
+        db.session.add_all([
+            Post(title=f'post {i}', body='', author_id=2, likes=i,
+                 created=datetime(2020, 1, 1 + i), tags=[tag] if i % 2 else [])
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+def test_posts_requires_login(client):
+    assert client.get('/api/posts').headers['Location'] == '/auth/login'
+
+
+def test_posts(client, auth, app):
+    _add_posts(app, 3)
+    auth.login()
+    data = client.get('/api/posts').get_json()
+    assert data['older'] is None and data['newer'] is None
+    assert data['posts'][0] == {'id': 4, 'title': 'post 2', 'created': '2020-01-03T00:00:00',
+                                'likes': 2, 'author': 'other', 'tags': []}
+    assert data['posts'][1]['tags'] == ['news']
+    assert [post['title'] for post in data['posts']][-1] == 'test title'
+
+
+def test_posts_fields(client, auth, app):
+    _add_posts(app, 1)
+    auth.login()
+    data = client.get('/api/posts?fields=id,author').get_json()
+    assert data['posts'] == [{'id': 2, 'author': 'other'}, {'id': 1, 'author': 'test'}]
+
+    response = client.get('/api/posts?fields=id,password')
+    assert response.status_code == 400
+    assert 'password' in response.get_json()['error']
+
+
+def test_posts_pagination(client, auth, app):
+    _add_posts(app, 5)
+    auth.login()
+    seen = []
+    url = '/api/posts?fields=title&limit=2'
+    while True:
+        data = client.get(url).get_json()
+        seen.extend(post['title'] for post in data['posts'])
+        if not data['older']:
+            break
+        url = f"/api/posts?fields=title&limit=2&older={data['older']}"
+    assert seen == [f'post {i}' for i in reversed(range(5))] + ['test title']
+
+    data = client.get(f"/api/posts?fields=title&limit=2&newer={data['newer']}").get_json()
+    assert [post['title'] for post in data['posts']] == ['post 2', 'post 1']
@@ -1,8 +1,10 @@
+from datetime import timedelta
+
 import pytest
 from flask import  session
 from flaskr.database import db
 from flaskr.models import User
-from flask_jwt_extended import current_user
+from flask_jwt_extended import create_access_token, current_user
 
 
 
@@ -52,3 +54,122 @@ def test_logout(client, auth):
     with client:
         auth.logout()
         assert 'user_id' not in session
+
+
+def test_identity_cache(client, auth, app, query_budget):
+    auth.login()
+    cache = app.extensions['identity_cache']
+    client.get('/')
+    assert cache.stats()['misses'] == 1
+
+    # the cached identity is served without touching the user table
+    with query_budget(4) as statements:
+        with client:
+            client.get('/')
+            assert current_user.username == 'test'
+    assert not any('FROM user' in statement for statement in statements)
+    assert cache.stats()['hits'] == 1
+
+
+def test_identity_cache_invalidated(client, auth, app):
+    auth.login()
+    client.get('/')
+    cache = app.extensions['identity_cache']
+    assert len(cache) == 1
+
+    with app.app_context():
+        user = db.session.get(User, 1)
+        user.username = 'renamed'
+        db.session.commit()
+    assert len(cache) == 0
+
+    with client:
+        client.get('/')
+        assert current_user.username == 'renamed'
+
+
+def test_ttl_cache_expiry_and_eviction():
+    from flaskr.cache import TTLCache
+
+    now = [0]
+    cache = TTLCache(maxsize=2, ttl=10, timer=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # 'b' was the least recently used entry
+    assert cache.get('b') is None
+    now[0] = 11
+    assert cache.get('a') is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'size': 1}
+
+
+def test_login_sets_refresh_token(client, auth, app):
+    auth.login()
+    assert client.get_cookie('access_token_cookie') is not None
+    refresh_cookie = client.get_cookie('refresh_token_cookie', path='/auth/refresh')
+    assert refresh_cookie is not None
+
+    stats = app.extensions['token_stats']
+    assert stats['access'] == 1 and stats['refresh'] == 1
+    for _ in range(5):
+        response = client.get('/')
+        assert 'Set-Cookie' not in response.headers
+    # a fresh access token is not re-signed on every response
+    assert stats['access'] == 1
+
+
+def test_expiring_access_token_is_renewed(client, auth, app):
+    auth.login()
+    with app.app_context():
+        token = create_access_token(identity=db.session.get(User, 1),
+                                    expires_delta=timedelta(minutes=1))
+    client.set_cookie('access_token_cookie', token)
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'access_token_cookie=' in response.headers['Set-Cookie']
+    assert app.extensions['token_stats']['access'] == 2
+
+
+def test_expired_access_token_uses_refresh_token(client, auth, app):
+    auth.login()
+    with app.app_context():
+        token = create_access_token(identity=db.session.get(User, 1),
+                                    expires_delta=timedelta(seconds=-1))
+    client.set_cookie('access_token_cookie', token)
+
+    response = client.get('/?older=x')
+    assert response.headers['Location'].startswith('/auth/refresh?next=')
+    response = client.get(response.headers['Location'])
+    assert response.headers['Location'] == '/?older=x'
+    assert client.get('/').status_code == 200
+
+
+def test_expired_access_token_without_refresh_token(client, app):
+    with app.app_context():
+        token = create_access_token(identity=db.session.get(User, 1),
+                                    expires_delta=timedelta(seconds=-1))
+    client.set_cookie('access_token_cookie', token)
+    response = client.get('/')
+    assert response.headers['Location'].startswith('/auth/refresh')
+    assert client.get(response.headers['Location']).headers['Location'] == '/auth/login'
+
+
+def test_refresh_rejects_external_next(client, auth):
+    auth.login()
+    response = client.get('/auth/refresh?next=//evil.example')
+    assert response.headers['Location'] == '/'
+
+
+@pytest.mark.parametrize('next_url', (
+    '/%09/evil.example',
+    '/%5Cevil.example',
+    '%5C%5Cevil.example',
+    '///evil.example',
+    'https://evil.example/',
+    'javascript:alert(1)',
+))
+def test_refresh_rejects_disguised_external_next(client, auth, next_url):
+    auth.login()
+    response = client.get(f'/auth/refresh?next={next_url}')
+    assert response.headers['Location'] == '/'
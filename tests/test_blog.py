@@ -1,6 +1,12 @@
+import base64
+import json
+import re
+import threading
+from datetime import datetime
+
 import pytest
 from flaskr.database import db
-from flaskr.models import User, Post, LikedPosts
+from flaskr.models import User, Post, LikedPosts, Tags
 from sqlalchemy import func
 
 
@@ -83,6 +89,34 @@ def test_delete(client, auth, app):
         assert post is None
 
 
+def test_delete_cascades(client, auth, app, query_budget):
+    from flaskr.models import tags_post
+
+    with app.app_context():
+        db.session.execute(db.insert(User), [
+            {'username': f'fan{i}', 'password': ''} for i in range(200)
+        ])
+        db.session.execute(db.insert(LikedPosts), [
+            {'user_id': user_id, 'post_id': 1} for user_id in range(1, 203)
+        ])
+        db.session.add(Tags(name='doomed', post_count=1))
+        db.session.flush()
+        db.session.execute(db.insert(tags_post).values(post_id=1, tag_id=1))
+        db.session.commit()
+
+    auth.login()
+    # the likes are removed by the database, not loaded and deleted one by one
+    with query_budget(8) as statements:
+        client.post('/1/delete')
+    assert not any('FROM liked_posts' in statement for statement in statements)
+
+    with app.app_context():
+        count = lambda table: db.session.execute(db.select(func.count()).select_from(table)).scalar()
+        assert count(LikedPosts) == 0
+        assert count(tags_post) == 0
+        assert db.session.get(Tags, 1).post_count == 0
+
+
 def test_like(client, auth, app):
     auth.login()
     response = client.post('/1/like')
@@ -233,3 +267,579 @@ def test_parameterized(auth, blog,  postid, is_logged_in, status_code):
         assert response.headers["Location"] == "/auth/login"
     response = blog.like(postid)
     assert response.status_code == status_code
+
+
+def test_index_pagination(client, auth, app):
+    app.config['FEED_PAGE_SIZE'] = 3
+    with app.app_context():
+        # several posts share a timestamp so the id tie-breaker is exercised
+        db.session.execute(db.insert(Post), [
+            {'title': f'post {i}', 'body': '', 'author_id': 1,
+             'created': datetime(2020, 1, 1 + i // 2), 'likes': 0}
+            for i in range(7)
+        ])
+        db.session.commit()
+
+    auth.login()
+    seen = []
+    response = client.get('/')
+    while True:
+        html = response.data.decode()
+        titles = re.findall(r'<h1>(.*?)</h1>', html)[2:]
+        assert len(titles) <= 3
+        seen.extend(titles)
+        match = re.search(r'href="/\?older=([^"]+)"', html)
+        if match is None:
+            break
+        response = client.get(f'/?older={match.group(1)}')
+
+    assert seen == [f'post {i}' for i in reversed(range(7))] + ['test title']
+
+    # walking back from the last page returns the previous one
+    newer = re.search(r'href="/\?newer=([^"]+)"', html).group(1)
+    html = client.get(f'/?newer={newer}').data.decode()
+    assert re.findall(r'<h1>(.*?)</h1>', html)[2:] == ['post 3', 'post 2', 'post 1']
+
+
+def test_index_bad_cursor(client, auth):
+    auth.login()
+    response = client.get('/?older=not-a-cursor')
+    assert response.status_code == 200
+    assert b'test title' in response.data
+
+
+def _cursor(values):
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+@pytest.mark.parametrize(('path', 'values'), (
+    ('/', ['2020-01-01T00:00:00', {}]),
+    ('/', [1, 1]),
+    ('/api/posts', ['2020-01-01T00:00:00', {}]),
+    ('/trending', [{}, 1]),
+    ('/trending', ['x', 1]),
+    ('/trending', [1.5, True]),
+    ('/me/likes', [[1]]),
+    ('/1/likers', [{'a': 1}]),
+))
+def test_type_tampered_cursor(client, auth, path, values):
+    auth.login()
+    cursor = _cursor(values)
+    assert client.get(f'{path}?older={cursor}').status_code == 200
+    assert client.get(f'{path}?newer={cursor}').status_code == 200
+
+
+def _add_tagged_posts(app, count=10):
+    with app.app_context():
+        tags = [Tags(name=f'tag{i}') for i in range(3)]
+        db.session.add_all(tags)
+        for i in range(count):
+            db.session.add(Post(title=f'tagged {i}', body='', author_id=1 + i % 2, tags=tags))
+        db.session.commit()
+
+
+def test_index_query_budget(client, auth, app, query_budget):
+    _add_tagged_posts(app)
+    auth.login()
+    # identity lookup, content version, feed page, tags of the page, liked posts
+    with query_budget(5):
+        response = client.get('/')
+    assert b'tagged 9' in response.data
+    assert b'tag2' in response.data
+
+
+def test_tags_query_budget(client, app, query_budget):
+    _add_tagged_posts(app)
+    # content version, tags, top posts of every tag
+    with query_budget(3):
+        response = client.get('/tags')
+    assert b'tagged 9' in response.data
+
+
+def test_update_query_budget(client, auth, app, query_budget):
+    _add_tagged_posts(app)
+    auth.login()
+    # identity lookup, post with author, its tags, all tags
+    with query_budget(4):
+        assert client.get('/2/update').status_code == 200
+
+
+def test_liked_post_ids(app):
+    from flaskr.queries import liked_post_ids
+
+    with app.app_context():
+        db.session.add(Post(title='second', body='', author_id=1))
+        db.session.add_all([LikedPosts(user_id=1, post_id=1), LikedPosts(user_id=1, post_id=2),
+                            LikedPosts(user_id=2, post_id=1)])
+        db.session.commit()
+
+        assert liked_post_ids(1, [1, 2]) == {1, 2}
+        assert liked_post_ids(1, [2]) == {2}
+        assert liked_post_ids(2, [2]) == set()
+        assert liked_post_ids(1, []) == set()
+
+
+@pytest.mark.parametrize('write_behind', (False, True))
+def test_like_concurrent_toggles(monkeypatch, tmp_path, write_behind):
+    # threads need their own connections, which an in-memory database can't give
+    from flask_jwt_extended import create_access_token
+    from flaskr import create_app
+    from flaskr.blog import flush_like_buffer
+    from flaskr.config import TestingConfig
+
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI',
+                        f"sqlite:///{tmp_path / 'likes.db'}")
+    monkeypatch.setattr(TestingConfig, 'LIKES_WRITE_BEHIND', write_behind)
+    monkeypatch.setattr(TestingConfig, 'LIKES_FLUSH_SIZE', 7)
+    app = create_app(config_mode='testing')
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'user{i}', password='x') for i in range(8)]
+        post = Post(title='popular', body='', author=users[0], likes=0)
+        db.session.add_all(users + [post])
+        db.session.commit()
+        post_id = post.id
+        tokens = [create_access_token(identity=user) for user in users]
+
+    errors = []
+
+    def click(token, times):
+        client = app.test_client()
+        client.set_cookie('access_token_cookie', token)
+        try:
+            for _ in range(times):
+                assert client.post(f'/{post_id}/like').status_code == 302
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=click, args=(token, 5 + i))
+               for i, token in enumerate(tokens)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    with app.app_context():
+        if write_behind:
+            flush_like_buffer(app.extensions['like_buffer'])
+        likes = db.session.execute(db.select(Post.likes).where(Post.id == post_id)).scalar()
+        stmt = db.select(func.count()).select_from(LikedPosts).where(LikedPosts.post_id == post_id)
+        assert likes == db.session.execute(stmt).scalar()
+        # odd click counts leave a like behind
+        assert likes == 4
+
+
+def test_post_fragment_cache(client, auth, app):
+    auth.login()
+    cache = app.extensions['fragment_cache']
+    client.get('/')
+    client.get('/')
+    assert cache.stats()['hits'] == 1
+
+    client.post('/1/update', data={'title': 'updated', 'body': 'new body'})
+    response = client.get('/')
+    assert b'updated' in response.data
+    assert b'new body' in response.data
+
+    # likes and the viewer's button sit outside the cached fragment
+    client.post('/1/like')
+    response = client.get('/')
+    assert b'Likes: 11' in response.data
+    assert b'Unlike' in response.data
+
+
+def test_post_fragment_version_mismatch(client, auth, app):
+    auth.login()
+    client.get('/')
+    # a write made elsewhere only bumps the stored version
+    with app.app_context():
+        db.session.execute(db.update(Post).where(Post.id == 1)
+                           .values(title='changed elsewhere', version=Post.version + 1))
+        db.session.commit()
+    assert b'changed elsewhere' in client.get('/').data
+
+
+def test_post_fragment_deleted_elsewhere(monkeypatch, tmp_path):
+    # two workers on one database file, each with its own fragment cache
+    from flask_jwt_extended import create_access_token
+    from flaskr import create_app
+    from flaskr.config import TestingConfig
+
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI',
+                        f"sqlite:///{tmp_path / 'shared.db'}")
+    apps = [create_app(config_mode='testing'), create_app(config_mode='testing')]
+    with apps[0].app_context():
+        db.create_all()
+        user = User(username='author', password='x')
+        db.session.add_all([user, Post(title='first', body='old body', author=user, likes=0)])
+        db.session.commit()
+        token = create_access_token(identity=user)
+    clients = []
+    for app in apps:
+        client = app.test_client()
+        client.set_cookie('access_token_cookie', token)
+        clients.append(client)
+
+    assert b'old body' in clients[0].get('/').data
+    clients[1].post('/1/delete')
+    clients[1].post('/create', data={'title': 'second', 'body': 'new body'})
+    html = clients[0].get('/').data
+    assert b'new body' in html
+    assert b'old body' not in html
+
+
+def test_index_not_modified(client, auth):
+    auth.login()
+    response = client.get('/')
+    etag = response.headers['ETag']
+    assert 'private' in response.headers['Cache-Control']
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    # any write changes the tag
+    client.post('/1/like')
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_index_etag_depends_on_viewer(client, auth, app):
+    auth.login()
+    etag = client.get('/').headers['ETag']
+    auth.login('other', 'other')
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_index_etag_depends_on_cursor(client, auth):
+    auth.login()
+    etag = client.get('/').headers['ETag']
+    assert client.get('/?older=x', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_not_modified_skips_feed_query(client, auth, query_budget):
+    auth.login()
+    etag = client.get('/').headers['ETag']
+    with query_budget(2) as statements:
+        assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert not any('FROM post' in statement for statement in statements)
+
+
+def test_tags_not_modified(client, auth, app):
+    from datetime import timedelta, timezone
+    from flaskr.models import ContentVersion
+
+    etag = client.get('/tags').headers['ETag']
+    assert client.get('/tags', headers={'If-None-Match': etag}).status_code == 304
+
+    auth.login()
+    client.post('/add-tag', json={'tag_name': 'new'})
+    response = client.get('/tags', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    # another write this second would keep the date, so none is sent yet
+    assert 'Last-Modified' not in response.headers
+
+    with app.app_context():
+        db.session.execute(db.update(ContentVersion).values(
+            updated=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=1)))
+        db.session.commit()
+    response = client.get('/tags')
+    last_modified = response.headers['Last-Modified']
+    response = client.get('/tags', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+
+def test_tag_feed(client, auth, app):
+    app.config['FEED_PAGE_SIZE'] = 2
+    _add_tagged_posts(app, count=3)
+    with app.app_context():
+        db.session.add(Tags(name='empty'))
+        db.session.commit()
+
+    auth.login()
+    response = client.get('/tags/tag1')
+    html = response.data.decode()
+    assert 'Posts tagged tag1' in html
+    assert re.findall(r'<h1>(.*?)</h1>', html)[2:] == ['tagged 2', 'tagged 1']
+    older = re.search(r'href="/tags/tag1\?older=([^"]+)"', html).group(1)
+    html = client.get(f'/tags/tag1?older={older}').data.decode()
+    assert re.findall(r'<h1>(.*?)</h1>', html)[2:] == ['tagged 0']
+
+    assert b'<article' not in client.get('/tags/empty').data
+    assert client.get('/tags/missing').status_code == 404
+
+
+
+def test_tag_feed_order_from_index(client, auth, app):
+    from sqlalchemy import event
+
+    app.config['FEED_PAGE_SIZE'] = 3
+    _add_tagged_posts(app)
+    auth.login()
+    with app.app_context():
+        engine = db.engine
+    feed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'JOIN tags_post' in statement and 'ORDER BY' in statement:
+            feed.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        html = client.get('/tags/tag1').data.decode()
+        older = re.search(r'href="/tags/tag1\?older=([^"]+)"', html).group(1)
+        client.get(f'/tags/tag1?older={older}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert len(feed) == 2
+    with app.app_context():
+        conn = db.session.connection().connection
+        for statement, parameters in feed:
+            plan = ' '.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}', parameters))
+            assert 'ix_tags_post_tag_id_post_id' in plan
+            assert 'TEMP B-TREE' not in plan
+
+
+def test_tags_post_is_unique(app):
+    from sqlalchemy.exc import IntegrityError
+    from flaskr.models import tags_post
+
+    _add_tagged_posts(app, count=1)
+    with app.app_context():
+        with pytest.raises(IntegrityError):
+            db.session.execute(db.insert(tags_post).values(post_id=2, tag_id=1))
+        db.session.rollback()
+
+
+def test_export_endpoint(client, auth):
+    assert client.get('/export.ndjson').headers['Location'] == '/auth/login'
+    auth.login()
+    response = client.get('/export.ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    lines = response.data.decode().splitlines()
+    assert len(lines) == 1
+    assert '"title": "test title"' in lines[0]
+
+
+def _tag_counts(app):
+    with app.app_context():
+        stmt = db.select(Tags.name, Tags.post_count).order_by(Tags.name)
+        return dict(db.session.execute(stmt).all())
+
+
+def test_tag_counts_follow_writes(client, auth, app):
+    with app.app_context():
+        db.session.add_all([Tags(name='a'), Tags(name='b'), Tags(name='c')])
+        db.session.commit()
+    auth.login()
+
+    client.post('/create', data={'title': 'one', 'body': '', 'tags': ['1', '2']})
+    client.post('/create', data={'title': 'two', 'body': '', 'tags': ['2']})
+    assert _tag_counts(app) == {'a': 1, 'b': 2, 'c': 0}
+
+    client.post('/2/update', data={'title': 'one', 'body': '', 'tags': ['2', '3']})
+    assert _tag_counts(app) == {'a': 0, 'b': 2, 'c': 1}
+
+    client.post('/2/delete')
+    assert _tag_counts(app) == {'a': 0, 'b': 1, 'c': 0}
+
+
+def test_tags_page_top_posts(client, app):
+    app.config['TAGS_TOP_POSTS'] = 2
+    with app.app_context():
+        tag = Tags(name='news', post_count=3)
+        db.session.add_all([
+            Post(title=f'news {i}', body='', author_id=1, likes=10 - i,
+                 created=datetime(2020, 1, 1 + i), tags=[tag])
+            for i in range(3)
+        ])
+        db.session.add(Tags(name='quiet'))
+        db.session.commit()
+
+    html = client.get('/tags').data.decode()
+    assert 'news 2' in html and 'news 1' in html and 'news 0' not in html
+    assert html.count('>more</a>') == 1
+
+    html = client.get('/tags?sort=liked').data.decode()
+    assert 'news 0' in html and 'news 1' in html and 'news 2' not in html
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    from flaskr.config import TestingConfig
+    monkeypatch.setattr(TestingConfig, 'LIKES_WRITE_BEHIND', True)
+    monkeypatch.setattr(TestingConfig, 'LIKES_FLUSH_INTERVAL', 3600)
+
+
+def test_like_write_behind(write_behind, client, auth, app):
+    from flaskr.blog import flush_like_buffer
+
+    auth.login()
+    etag = client.get('/').headers['ETag']
+    assert client.post('/1/like').status_code == 302
+
+    with app.app_context():
+        # the like itself is durable, the counter waits for the flush
+        assert db.session.get(LikedPosts, (1, 1)) is not None
+        assert db.session.get(Post, 1).likes == 10
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Likes: 11' in response.data
+    assert client.get('/api/posts?fields=id,likes').json['posts'] == [{'id': 1, 'likes': 11}]
+
+    with app.app_context():
+        buffer = app.extensions['like_buffer']
+        flush_like_buffer(buffer)
+        assert len(buffer) == 0
+        assert db.session.get(Post, 1).likes == 11
+    assert b'Likes: 11' in client.get('/').data
+
+
+def test_like_write_behind_flush_size(write_behind, client, auth, app):
+    app.extensions['like_buffer'].flush_size = 3
+
+    auth.login()
+    for _ in range(3):
+        client.post('/1/like')
+    with app.app_context():
+        assert db.session.get(Post, 1).likes == 11
+        assert len(app.extensions['like_buffer']) == 0
+
+
+def test_like_write_behind_etag_after_flush(write_behind, client, auth, app):
+    from flaskr.blog import flush_like_buffer
+
+    auth.login()
+    client.post('/1/like')
+    with app.app_context():
+        buffer = app.extensions['like_buffer']
+        flush_like_buffer(buffer)
+    etag = client.get('/').headers['ETag']
+    # with nothing pending, another worker's buffer doesn't change the tag
+    buffer._token = 'another'
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/1/like')
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_like_write_behind_idle_flush(write_behind, client, auth, app):
+    import time
+
+    app.extensions['like_buffer'].flush_interval = 0.05
+    auth.login()
+    client.post('/1/like')
+    buffer = app.extensions['like_buffer']
+    # no further requests: the background thread writes the counter
+    deadline = time.monotonic() + 5
+    while len(buffer) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with app.app_context():
+        assert db.session.get(Post, 1).likes == 11
+
+
+def test_like_write_behind_missing_post(write_behind, client, auth, app):
+    auth.login()
+    assert client.post('/42/like').status_code == 404
+    assert len(app.extensions['like_buffer']) == 0
+
+
+def test_trending(client, auth, app):
+    app.config['FEED_PAGE_SIZE'] = 2
+    with app.app_context():
+        db.session.execute(db.insert(Post), [
+            {'title': f'post {i}', 'body': '', 'author_id': 1, 'likes': 0, 'score': score}
+            for i, score in enumerate([0.5, 3.0, 1.5, 3.0])
+        ])
+        db.session.commit()
+
+    auth.login()
+    # post 1 overtakes post 3 with a like
+    client.post('/3/like')
+    seen = []
+    response = client.get('/trending')
+    while True:
+        html = response.data.decode()
+        assert 'Trending' in html
+        seen.extend(re.findall(r'<h1>(.*?)</h1>', html)[2:])
+        match = re.search(r'href="/trending\?older=([^"]+)"', html)
+        if match is None:
+            break
+        response = client.get(f'/trending?older={match.group(1)}')
+    assert seen == ['post 1', 'post 3', 'post 2', 'test title', 'post 0']
+
+
+def test_like_updates_score(client, auth, app):
+    auth.login()
+    client.post('/create', data={'title': 'new', 'body': ''})
+    client.post('/2/like')
+    with app.app_context():
+        assert db.session.get(Post, 2).score == 2.0
+    client.post('/2/like')
+    with app.app_context():
+        assert db.session.get(Post, 2).score == 1.0
+
+    # a decayed score can't go below 0 when the like is taken back
+    client.post('/2/like')
+    with app.app_context():
+        db.session.execute(db.update(Post).where(Post.id == 2).values(score=0.25))
+        db.session.commit()
+    client.post('/2/like')
+    with app.app_context():
+        assert db.session.get(Post, 2).score == 0.0
+
+
+def test_likers(client, auth, app, query_budget):
+    app.config['FEED_PAGE_SIZE'] = 2
+    with app.app_context():
+        db.session.execute(db.insert(User), [
+            {'username': f'fan{i}', 'password': ''} for i in range(3)
+        ])
+        db.session.execute(db.insert(LikedPosts), [
+            {'user_id': user_id, 'post_id': 1} for user_id in (2, 3, 4, 5)
+        ])
+        db.session.commit()
+
+    auth.login()
+    # user, content version, post title, one page of likers
+    with query_budget(4):
+        html = client.get('/1/likers').data.decode()
+    assert 'test title' in html
+    assert re.findall(r'<li>(fan\d|other)</li>', html) == ['fan2', 'fan1']
+    older = re.search(r'href="/1/likers\?older=([^"]+)"', html).group(1)
+    html = client.get(f'/1/likers?older={older}').data.decode()
+    assert re.findall(r'<li>(fan\d|other)</li>', html) == ['fan0', 'other']
+    assert client.get('/42/likers').status_code == 404
+
+
+def test_my_likes(client, auth, app):
+    app.config['FEED_PAGE_SIZE'] = 2
+    with app.app_context():
+        db.session.execute(db.insert(Post), [
+            {'title': f'post {i}', 'body': '', 'author_id': 2, 'likes': 0} for i in range(4)
+        ])
+        db.session.commit()
+
+    auth.login()
+    for post_id in (1, 2, 4, 5):
+        client.post(f'/{post_id}/like')
+    html = client.get('/me/likes').data.decode()
+    assert 'Liked posts' in html
+    assert re.findall(r'<h1>(.*?)</h1>', html)[2:] == ['post 3', 'post 2']
+    assert html.count('Unlike') == 2
+    older = re.search(r'href="/me/likes\?older=([^"]+)"', html).group(1)
+    html = client.get(f'/me/likes?older={older}').data.decode()
+    assert re.findall(r'<h1>(.*?)</h1>', html)[2:] == ['post 0', 'test title']
+
+
+def test_liked_posts_post_lookup_uses_index(app):
+    with app.app_context():
+        plan = db.session.execute(db.text(
+            'EXPLAIN QUERY PLAN SELECT user_id FROM liked_posts WHERE post_id = 1'
+        )).all()
+    assert 'ix_liked_posts_post_id_user_id' in ' '.join(row[-1] for row in plan)
@@ -0,0 +1,220 @@
+import json
+import os
+
+import pytest
+from flaskr.database import db
+from flaskr.models import LikedPosts, Post, Tags, tags_post
+from sqlalchemy import func
+
+
+def _write_lines(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    return str(path)
+
+
+def test_import_posts(runner, app, tmp_path):
+    records = [
+        {'title': f'imported {i}', 'body': 'body', 'author_id': 1 + i % 2,
+         'created': f'2021-01-{i + 1:02d}T10:00:00',
+         'tags': ['news', f'tag{i % 3}'], 'liked_by': [1, 2][:i % 3]}
+        for i in range(25)
+    ]
+    path = _write_lines(tmp_path / 'posts.jsonl', records)
+
+    result = runner.invoke(args=['import-posts', path, '--batch-size', '4', '--commit-every', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Imported 25 posts, 50 tag links and 24 likes' in result.output
+
+    with app.app_context():
+        assert db.session.execute(db.select(func.count(Post.id))).scalar() == 26
+        stmt = db.select(Tags.name, Tags.post_count).order_by(Tags.name)
+        assert db.session.execute(stmt).all() == [('news', 25), ('tag0', 9), ('tag1', 8), ('tag2', 8)]
+        assert db.session.execute(db.select(func.count()).select_from(tags_post)).scalar() == 50
+        post = db.session.execute(db.select(Post).where(Post.title == 'imported 2')).scalar()
+        assert post.likes == 2
+        assert post.created.day == 3
+        assert sorted(tag.name for tag in post.tags) == ['news', 'tag2']
+        stmt = db.select(LikedPosts.user_id).where(LikedPosts.post_id == post.id)
+        assert sorted(db.session.execute(stmt).scalars()) == [1, 2]
+        # years old: the trending score has long decayed
+        assert post.score == 0.0
+
+
+def test_import_posts_scores(runner, app, tmp_path):
+    from datetime import datetime, timedelta, timezone
+
+    created = datetime.now(timezone.utc) - app.config['TRENDING_HALF_LIFE']
+    path = _write_lines(tmp_path / 'posts.jsonl', [
+        {'title': 'liked', 'body': '', 'author_id': 1, 'created': created.isoformat(), 'likes': 7},
+        {'title': 'fresh', 'body': '', 'author_id': 1},
+    ])
+    assert runner.invoke(args=['import-posts', path]).exit_code == 0
+    with app.app_context():
+        scores = dict(db.session.execute(db.select(Post.title, Post.score).where(Post.id > 1)).all())
+    # as if the likes had come in with the post, one half-life ago
+    assert scores == {'liked': pytest.approx(4.0, rel=1e-3), 'fresh': pytest.approx(1.0)}
+
+
+def test_import_posts_reuses_tags(runner, app, tmp_path):
+    with app.app_context():
+        db.session.add(Tags(name='news'))
+        db.session.commit()
+    path = _write_lines(tmp_path / 'posts.jsonl',
+                        [{'title': 'a', 'body': '', 'author_id': 1, 'tags': ['news']}])
+
+    assert runner.invoke(args=['import-posts', path]).exit_code == 0
+    with app.app_context():
+        assert db.session.execute(db.select(func.count(Tags.id))).scalar() == 1
+
+
+def test_import_posts_bad_line(runner, app, tmp_path):
+    path = tmp_path / 'posts.jsonl'
+    path.write_text(json.dumps({'title': 'kept', 'body': '', 'author_id': 1}) + '\nnot json\n')
+
+    result = runner.invoke(args=['import-posts', str(path), '--batch-size', '1', '--commit-every', '1'])
+    assert result.exit_code != 0
+    assert 'Invalid JSON in batch 2' in result.output
+    with app.app_context():
+        assert db.session.execute(db.select(Post).where(Post.title == 'kept')).scalar() is not None
+
+
+@pytest.mark.parametrize(('record', 'message'), (
+    ({'body': '', 'author_id': 1}, 'missing title'),
+    ({'title': 'x', 'author_id': '1'}, 'author_id must be int'),
+    ({'title': 'x', 'author_id': 1, 'created': 'yesterday'}, 'Invalid isoformat'),
+    ({'title': 'x', 'author_id': 99}, 'no user with id 99'),
+    ({'title': 'x', 'author_id': 1, 'liked_by': [2, 99]}, 'no user with id 99'),
+))
+def test_import_posts_bad_record(runner, app, tmp_path, record, message):
+    path = _write_lines(tmp_path / 'posts.jsonl', [
+        {'title': 'kept', 'body': '', 'author_id': 1},
+        {'title': 'dropped', 'body': '', 'author_id': 2},
+        record,
+    ])
+
+    result = runner.invoke(args=['import-posts', path, '--batch-size', '2', '--commit-every', '1'])
+    assert result.exit_code == 1
+    assert f'Invalid record in batch 2, line 3: {message}' in result.output
+    assert 'Earlier transactions were kept' in result.output
+    with app.app_context():
+        titles = db.session.execute(db.select(Post.title).where(Post.id > 1)).scalars().all()
+    assert titles == ['kept', 'dropped']
+
+
+def test_export_posts(runner, app, tmp_path):
+    with app.app_context():
+        tag = Tags(name='news')
+        post = Post(title='second', body='b', author_id=2, tags=[tag], likes=2)
+        db.session.add(post)
+        db.session.flush()
+        db.session.add_all([LikedPosts(user_id=1, post_id=post.id), LikedPosts(user_id=2, post_id=post.id)])
+        db.session.commit()
+
+    path = tmp_path / 'export.jsonl'
+    # one post per batch, tags and likers are looked up batch by batch
+    result = runner.invoke(args=['export-posts', str(path), '--batch-size', '1'])
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record['title'] for record in records] == ['test title', 'second']
+    assert records[0]['tags'] == [] and records[0]['liked_by'] == []
+    assert records[0]['created'] == '2018-01-01T00:00:00'
+    assert records[1]['tags'] == ['news']
+    assert sorted(records[1]['liked_by']) == [1, 2]
+
+    # the export is valid input for import-posts
+    assert runner.invoke(args=['import-posts', str(path)]).exit_code == 0
+    with app.app_context():
+        assert db.session.execute(db.select(func.count(Post.id))).scalar() == 4
+        assert db.session.execute(db.select(func.count(Tags.id))).scalar() == 1
+
+
+def _seed_snapshot(app):
+    with app.app_context():
+        posts = db.session.execute(
+            db.select(Post.title, Post.author_id, Post.likes, Post.created).where(Post.id > 1).order_by(Post.id)
+        ).all()
+        links = db.session.execute(db.select(tags_post.c.post_id, tags_post.c.tag_id)
+                                   .order_by(tags_post.c.post_id, tags_post.c.tag_id)).all()
+        return posts, links
+
+
+def test_seed(runner, app):
+    args = ['seed', '--users', '20', '--posts', '300', '--tags', '8', '--batch-size', '64',
+            '--until', '2024-05-01']
+    result = runner.invoke(args=args)
+    assert result.exit_code == 0, result.output
+    assert 'Seeded 20 users, 8 tags, 300 posts' in result.output
+
+    with app.app_context():
+        count = lambda stmt: db.session.execute(stmt).scalar()
+        assert count(db.select(func.count(Post.id))) == 301
+        # likes match the stored counters, tag counts match the links
+        seeded = Post.id > 1
+        assert count(db.select(func.sum(Post.likes)).where(seeded)) == count(
+            db.select(func.count()).select_from(LikedPosts).where(LikedPosts.post_id > 1))
+        assert count(db.select(func.sum(Tags.post_count))) == count(
+            db.select(func.count()).select_from(tags_post))
+        assert count(db.select(func.max(Post.created)).where(seeded)).date().isoformat() == '2024-05-01'
+        # skewed: the most active author wrote far more than an even share
+        top = count(db.select(func.count()).where(seeded).group_by(Post.author_id)
+                    .order_by(func.count().desc()).limit(1))
+        assert top > 3 * 300 / 20
+        assert count(db.select(func.max(func.length(Post.body)))) <= 300
+
+
+def test_seed_is_deterministic(runner, app):
+    from flaskr import create_app
+
+    args = ['seed', '--users', '5', '--posts', '50', '--tags', '4', '--until', '2024-05-01']
+    assert runner.invoke(args=args).exit_code == 0
+
+    other = create_app(config_mode='testing')
+    with other.app_context():
+        db.create_all()
+        with open(os.path.join(os.path.dirname(__file__), 'data.sql')) as f:
+            db.session.connection().connection.executescript(f.read())
+    assert other.test_cli_runner().invoke(args=args).exit_code == 0
+    assert _seed_snapshot(other) == _seed_snapshot(app)
+
+
+def test_recount_likes(runner, app):
+    with app.app_context():
+        db.session.add(LikedPosts(user_id=2, post_id=1))
+        db.session.commit()
+
+    result = runner.invoke(args=['recount-likes'])
+    assert 'Fixed the like count of 1 posts' in result.output
+    with app.app_context():
+        assert db.session.get(Post, 1).likes == 1
+    assert 'of 0 posts' in runner.invoke(args=['recount-likes']).output
+
+
+def test_decay_scores(runner, app):
+    from datetime import datetime, timedelta, timezone
+    from flaskr.conditional import content_version
+    from flaskr.models import ScoreDecay
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        db.session.execute(db.insert(Post), [
+            {'title': f'p{score}', 'body': '', 'author_id': 1, 'likes': 0, 'score': score}
+            for score in (4.0, 0.015)
+        ])
+        db.session.commit()
+
+    # the first run only starts the clock
+    assert 'from now on' in runner.invoke(args=['decay-scores']).output
+    with app.app_context():
+        db.session.execute(db.update(ScoreDecay).values(decayed=now - timedelta(hours=24)))
+        db.session.commit()
+
+    with app.app_context():
+        version = content_version()[0]
+    result = runner.invoke(args=['decay-scores'])
+    assert 'Decayed 3 post scores by 0.50' in result.output
+    with app.app_context():
+        scores = db.session.execute(db.select(Post.score).order_by(Post.id)).scalars().all()
+        assert scores == [pytest.approx(0.5, rel=1e-3), pytest.approx(2.0, rel=1e-3), 0.0]
+        # cached trending pages are stale
+        assert content_version()[0] > version
+        assert (now - db.session.get(ScoreDecay, 1).decayed) < timedelta(minutes=1)
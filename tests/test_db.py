@@ -25,3 +25,106 @@
 #     result = runner.invoke(args=['init-db'])
 #     assert 'Initialized' in result.output
 #     assert Recorder.called
+
+
+import os
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from flaskr import create_app
+from flaskr.config import TestingConfig
+from flaskr.database import PRIMARY_COOKIE, REPLICA_BIND, db, sqlite_read_only_uri
+
+
+@pytest.fixture
+def replica_app(monkeypatch, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'primary.db'}"
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', uri)
+    monkeypatch.setattr(TestingConfig, 'READ_REPLICA_URI', sqlite_read_only_uri(uri))
+    app = create_app(config_mode='testing')
+    with app.app_context():
+        db.create_all()
+        with open(os.path.join(os.path.dirname(__file__), 'data.sql')) as f:
+            db.session.connection().connection.executescript(f.read())
+    return app
+
+
+def _statements(engine):
+    seen = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: seen.append(statement.split()[0]))
+    return seen
+
+
+def test_sqlite_read_only_uri():
+    assert sqlite_read_only_uri('sqlite:///blog.db') == 'sqlite:///file:blog.db?mode=ro&uri=true'
+    assert sqlite_read_only_uri('sqlite:///:memory:') is None
+    assert sqlite_read_only_uri('postgresql://localhost/blog') is None
+    assert sqlite_read_only_uri(None) is None
+
+
+def test_replica_is_read_only(replica_app):
+    with replica_app.app_context():
+        with pytest.raises(OperationalError, match='readonly'):
+            with db.engines[REPLICA_BIND].begin() as conn:
+                conn.execute(text("DELETE FROM post"))
+
+
+def test_get_reads_from_replica(replica_app):
+    client = replica_app.test_client()
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    client.delete_cookie(PRIMARY_COOKIE)
+    with replica_app.app_context():
+        primary = _statements(db.engine)
+        replica = _statements(db.engines[REPLICA_BIND])
+
+    assert client.get('/').status_code == 200
+    assert replica and set(replica) == {'SELECT'}
+    assert not primary
+
+
+def test_write_sticks_to_primary(replica_app):
+    client = replica_app.test_client()
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    client.delete_cookie(PRIMARY_COOKIE)
+    with replica_app.app_context():
+        primary = _statements(db.engine)
+        replica = _statements(db.engines[REPLICA_BIND])
+
+    response = client.post('/1/like')
+    assert response.status_code == 302
+    assert not replica
+    assert client.get_cookie(PRIMARY_COOKIE) is not None
+
+    # the next read of the same client sees its like on the primary
+    primary.clear()
+    assert b'Likes: 11' in client.get('/').data
+    assert not replica
+    assert 'SELECT' in primary
+
+
+def test_replica_of_rollback_journal_file(monkeypatch, tmp_path):
+    from flaskr.config import ProductionConfig
+
+    uri = f"sqlite:///{tmp_path / 'primary.db'}"
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', uri)
+    app = create_app(config_mode='testing')
+    with app.app_context():
+        db.create_all()
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+        db.engine.dispose()
+
+    # the replica opens the file first and can't switch it to WAL itself
+    monkeypatch.setattr(TestingConfig, 'READ_REPLICA_URI', sqlite_read_only_uri(uri))
+    monkeypatch.setattr(TestingConfig, 'SQLITE_PRAGMAS', ProductionConfig.SQLITE_PRAGMAS)
+    app = create_app(config_mode='testing')
+    with app.app_context():
+        replica = _statements(db.engines[REPLICA_BIND])
+    assert app.test_client().get('/tags').status_code == 200
+    assert replica
+    with app.app_context():
+        with db.engines[REPLICA_BIND].connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
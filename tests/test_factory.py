@@ -6,3 +6,75 @@ def test_config():
     assert create_app(config_mode="testing").testing
 
 
+
+
+def test_production_sqlite_pragmas(monkeypatch, tmp_path):
+    from sqlalchemy import text
+    from flaskr.config import ProductionConfig
+    from flaskr.database import REPLICA_BIND, db, sqlite_read_only_uri
+
+    uri = f"sqlite:///{tmp_path / 'prod.db'}"
+    monkeypatch.setattr(ProductionConfig, 'SQLALCHEMY_DATABASE_URI', uri)
+    monkeypatch.setattr(ProductionConfig, 'READ_REPLICA_URI', sqlite_read_only_uri(uri))
+    app = create_app(config_mode='production')
+    assert not app.debug
+    with app.app_context():
+        pragma = lambda name: db.session.execute(text(f'PRAGMA {name}')).scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1
+        assert pragma('busy_timeout') == 5000
+        assert pragma('temp_store') == 2
+        assert pragma('foreign_keys') == 1
+        assert db.engine.pool.size() == 10
+        with db.engines[REPLICA_BIND].connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+
+
+def test_create_app_skips_cli_only_imports():
+    import subprocess
+    import sys
+
+    # a fresh interpreter, this one has imported everything already
+    code = (
+        "import sys; from flaskr import create_app; create_app('testing'); "
+        "print(sorted({'alembic', 'flask_migrate', 'requests'} & set(sys.modules)))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, check=True, text=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_migrate_loaded_on_use():
+    import flask_migrate
+
+    app = create_app('testing')
+    assert app.test_cli_runner().invoke(args=['db', '--help']).output.count('upgrade') == 1
+    result = app.test_cli_runner().invoke(args=['db', 'current'])
+    assert result.exit_code == 0, result.output
+    # called directly, outside the flask command
+    with app.app_context():
+        flask_migrate.current()
+    assert isinstance(app.extensions['migrate'], flask_migrate._MigrateConfig)
+
+
+def test_import_skips_models():
+    import subprocess
+    import sys
+
+    code = "import sys, flaskr; print(sorted({'flaskr.models', 'flaskr.queries'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, check=True, text=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_dotenv_fills_unset_settings():
+    import os
+    import subprocess
+    import sys
+
+    # every database URL set, the rest of flaskr/.env is still read
+    env = {name: value for name, value in os.environ.items() if name != 'FLASK_CONFIG'}
+    env.update(dict.fromkeys(('DEVELOPMENT_DATABASE_URL', 'TEST_DATABASE_URL',
+                              'STAGING_DATABASE_URL', 'PRODUCTION_DATABASE_URL'), 'sqlite://'))
+    code = "import os, flaskr.config; print(bool(os.getenv('FLASK_CONFIG')))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, check=True,
+                            text=True, env=env)
+    assert result.stdout.strip() == 'True'
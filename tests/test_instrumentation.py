@@ -0,0 +1,49 @@
+import logging
+import re
+
+import pytest
+from flaskr.config import TestingConfig
+
+
+@pytest.fixture
+def instrumented(monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'INSTRUMENTATION_ENABLED', True)
+
+
+def _timings(response):
+    header = response.headers['Server-Timing']
+    return {
+        name: (desc, float(dur))
+        for name, desc, dur in re.findall(r'(\w+);desc="([^"]*)";dur=([\d.]+)', header)
+    }
+
+
+def test_disabled_by_default(client, auth):
+    auth.login()
+    assert 'Server-Timing' not in client.get('/').headers
+
+
+def test_server_timing(instrumented, client, auth, query_budget):
+    auth.login()
+    with query_budget(10) as statements:
+        response = client.get('/')
+    timings = _timings(response)
+    assert set(timings) == {'db', 'tpl', 'jwt', 'total'}
+    assert timings['db'][0] == f'{len(statements)} queries'
+    assert timings['total'][1] >= timings['tpl'][1]
+
+
+def test_anonymous_request(instrumented, client):
+    timings = _timings(client.get('/auth/login'))
+    assert 'jwt' not in timings
+    assert 'tpl' in timings
+
+
+def test_slow_request_log(instrumented, client, auth, caplog):
+    auth.login()
+    client.application.config['SLOW_REQUEST_MS'] = 0
+    with caplog.at_level(logging.WARNING):
+        client.get('/')
+    message = caplog.records[-1].getMessage()
+    assert message.startswith('Slow request GET /: ')
+    assert 'SELECT' in message
@@ -0,0 +1,87 @@
+import json
+import os
+import re
+
+import pytest
+from flaskr import create_app
+from flaskr.config import TestingConfig
+from flaskr.metrics import CONTENT_TYPE, Registry, render
+
+
+def _samples(text):
+    """``{'name{labels}': value}`` for every sample line of an exposition."""
+    return {
+        series: float(value)
+        for series, value in re.findall(r'^([^#\s][^ ]*) (\S+)$', text, re.M)
+    }
+
+
+def test_request_metrics(client, auth):
+    auth.login()
+    client.get('/')
+    client.get('/')
+    client.get('/1/update')
+    client.get('/nowhere')
+
+    response = client.get('/metrics')
+    assert response.headers['Content-Type'] == CONTENT_TYPE
+    samples = _samples(response.get_data(as_text=True))
+    assert samples['flaskr_requests_total{endpoint="blog.index",method="GET",status="200"}'] == 2
+    assert samples['flaskr_requests_total{endpoint="auth.login",method="POST",status="302"}'] == 1
+    assert samples['flaskr_requests_total{endpoint="unmatched",method="GET",status="404"}'] == 1
+    assert samples['flaskr_request_duration_seconds_count{endpoint="blog.index"}'] == 2
+    assert samples['flaskr_request_duration_seconds_bucket{endpoint="blog.index",le="+Inf"}'] == 2
+    assert samples['flaskr_request_duration_seconds_sum{endpoint="blog.index"}'] > 0
+
+
+def test_cache_ratio(client, auth):
+    auth.login()
+    client.get('/')
+    client.get('/')
+    samples = _samples(client.get('/metrics').get_data(as_text=True))
+    hits = samples['flaskr_cache_requests_total{cache="identity_cache",result="hit"}']
+    misses = samples['flaskr_cache_requests_total{cache="identity_cache",result="miss"}']
+    assert hits >= 1 and misses == 1
+    assert samples['flaskr_cache_hit_ratio{cache="identity_cache"}'] == pytest.approx(hits / (hits + misses), abs=1e-4)
+
+
+def test_histogram_buckets():
+    registry = Registry()
+    for seconds in (0.001, 0.02, 0.02, 7.0):
+        registry.observe('blog.index', 'GET', 200, seconds)
+    samples = _samples(render([registry.snapshot()]))
+    bucket = 'flaskr_request_duration_seconds_bucket{{endpoint="blog.index",le="{}"}}'.format
+    assert samples[bucket('0.005')] == 1
+    assert samples[bucket('0.01')] == 1
+    assert samples[bucket('0.025')] == 3
+    assert samples[bucket('5.0')] == 3
+    assert samples[bucket('+Inf')] == 4
+
+
+def test_workers_are_summed(monkeypatch, tmp_path):
+    directory = tmp_path / 'metrics'
+    monkeypatch.setattr(TestingConfig, 'METRICS_DIR', str(directory))
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'blog.db'}")
+    app = create_app(config_mode='testing')
+    client = app.test_client()
+    client.get('/auth/login')
+    assert (directory / f'{os.getpid()}.json').exists()
+
+    # another worker that has since exited
+    other = Registry()
+    other.observe('auth.login', 'GET', 200, 0.01)
+    other.gauges = {'pools': {'default': [3, 10]}, 'caches': {}}
+    dead = dict(other.snapshot(), pid=2 ** 22 + 1)
+    (directory / f"{dead['pid']}.json").write_text(json.dumps(dead))
+
+    samples = _samples(client.get('/metrics').get_data(as_text=True))
+    assert samples['flaskr_requests_total{endpoint="auth.login",method="GET",status="200"}'] == 2
+    assert samples[f'flaskr_db_pool_size{{bind="default",pid="{os.getpid()}"}}'] == 5
+    # a dead worker's pool is gone, its counts are not
+    assert not any(f'pid="{dead["pid"]}"' in series for series in samples)
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'METRICS_ENABLED', False)
+    app = create_app(config_mode='testing')
+    assert app.test_client().get('/metrics').status_code == 404
@@ -0,0 +1,63 @@
+import pytest
+from flaskr.database import db
+from flaskr.models import Post
+from flaskr.search import fts_query, search_posts
+
+
+@pytest.fixture
+def posts(app):
+    with app.app_context():
+        db.session.add_all([
+            Post(title='Sourdough starter', body='feeding flour and water', author_id=1),
+            Post(title='Weekend hike', body='bread and cheese on the summit', author_id=2),
+            Post(title='Bread', body='bread bread bread', author_id=1),
+        ])
+        db.session.commit()
+
+
+def test_fts_query_quotes_words():
+    assert fts_query('bread AND "cheese') == '"bread" "AND" "cheese"'
+    assert fts_query('  ') == ''
+
+
+def test_search_ranks_matches(app, posts):
+    with app.app_context():
+        results, has_more = search_posts('bread')
+        assert [post.title for post in results] == ['Bread', 'Weekend hike']
+        assert not has_more
+        results, _ = search_posts('bread cheese')
+        assert [post.title for post in results] == ['Weekend hike']
+
+
+def test_search_index_follows_writes(app, posts):
+    with app.app_context():
+        post = db.session.get(Post, 2)
+        post.title = 'Rye loaf'
+        db.session.commit()
+        assert [post.title for post in search_posts('rye')[0]] == ['Rye loaf']
+        assert search_posts('sourdough')[0] == []
+
+        db.session.delete(db.session.get(Post, 4))
+        db.session.commit()
+        assert [post.title for post in search_posts('bread')[0]] == ['Weekend hike']
+
+
+def test_search_pages(app, posts):
+    with app.app_context():
+        first, has_more = search_posts('bread', page=1, per_page=1)
+        second, last = search_posts('bread', page=2, per_page=1)
+        assert has_more and not last
+        assert [first[0].title, second[0].title] == ['Bread', 'Weekend hike']
+
+
+def test_search_views(client, auth, posts):
+    auth.login()
+    response = client.get('/search?q=summit')
+    assert response.status_code == 200
+    assert b'Weekend hike' in response.data
+
+    data = client.get('/search.json?q=bread&page=1').get_json()
+    assert [result['title'] for result in data['results']] == ['Bread', 'Weekend hike']
+    assert data['next_page'] is None
+
+    assert client.get('/search.json?q="').get_json()['results'] == []